@@ -0,0 +1,149 @@
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import uuid
+
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+os.environ.setdefault("SECRET_KEY", uuid.uuid4().hex)
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from fastapi import Depends, FastAPI, HTTPException, Request, status  # noqa: E402
+from fastapi.responses import StreamingResponse  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+import jwt  # noqa: E402
+from service import user as user_service  # noqa: E402
+from tools.middleware import AuthMiddleware, get_current_user, oauth2_scheme  # noqa: E402
+
+
+class LegacyAuthMiddleware(BaseHTTPMiddleware):
+    # The BaseHTTPMiddleware version this module replaced, kept for comparison.
+    async def dispatch(self, request: Request, call_next):
+        public_paths = ["/user/login", "/user/register", "/docs", "/openapi.json", "/user/verify-email", "/user/resend-verification", "/user/oauth/google", "/user/oauth/microsoft"]
+
+        if request.method == "OPTIONS" or request.url.path in public_paths:
+            return await call_next(request)
+
+        try:
+            token = await oauth2_scheme(request)
+            user = await user_service.verify_token(token)
+
+            if user is None:
+                return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"detail": "Invalid Token..."})
+            request.state.user = user
+        except jwt.ExpiredSignatureError:
+            return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"detail": "Token has expired"})
+        except HTTPException:
+            return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"detail": "Invalid Token..."})
+
+        response = await call_next(request)
+        return response
+
+
+class Principal:
+    email = "bench@example.com"
+
+
+async def fake_verify_token(token: str):
+    # Token verification has its own cache; the benchmark isolates what the middleware itself costs.
+    if token != "valid":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid Token.")
+    return Principal()
+
+
+def make_app(auth_middleware, chunks: int, chunk_delay: float) -> FastAPI:
+    app = FastAPI()
+    if auth_middleware is not None:
+        app.add_middleware(auth_middleware)
+
+    @app.get("/me")
+    async def me(user=Depends(get_current_user)) -> dict:
+        return {"email": user.email}
+
+    @app.get("/stream")
+    async def stream(user=Depends(get_current_user)):
+        async def body():
+            for i in range(chunks):
+                yield f"data: {i}\n\n".encode()
+                await asyncio.sleep(chunk_delay)
+        return StreamingResponse(body(), media_type="text/event-stream")
+
+    return app
+
+
+async def call(app, path: str, token: str | None) -> tuple[int, float, float]:
+    headers = [(b"host", b"bench")]
+    if token:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "", "headers": headers,
+        "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    started = time.perf_counter()
+    first_body = None
+    response_status = 0
+    received = False
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal first_body, response_status
+        if message["type"] == "http.response.start":
+            response_status = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body") and first_body is None:
+            first_body = time.perf_counter() - started
+
+    await app(scope, receive, send)
+    return response_status, time.perf_counter() - started, first_body or 0.0
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(args) -> None:
+    user_service.verify_token = fake_verify_token
+    variants = [("none", None), ("BaseHTTPMiddleware", LegacyAuthMiddleware), ("pure ASGI", AuthMiddleware)]
+    baseline = None
+    print(f"{args.requests} requests per scenario, {args.streams} streams of {args.chunks} chunks "
+          f"{args.chunk_delay * 1000:.0f} ms apart")
+    for name, auth in variants:
+        app = make_app(auth, args.chunks, args.chunk_delay)
+        for _ in range(args.warmup):
+            await call(app, "/me", "valid")
+
+        latencies = []
+        for _ in range(args.requests):
+            response_status, elapsed, _ = await call(app, "/me", "valid")
+            assert response_status == 200, response_status
+            latencies.append(elapsed)
+        mean = statistics.mean(latencies)
+        baseline = baseline if baseline is not None else mean
+        print(f"  {name:<20} p50 {percentile(latencies, 0.5) * 1e6:>7.1f} us  p99 {percentile(latencies, 0.99) * 1e6:>7.1f} us"
+              f"  overhead {(mean - baseline) * 1e6:>6.1f} us/request")
+
+        if auth is not None:
+            rejected = [await call(app, "/me", "broken") for _ in range(args.requests // 10 or 1)]
+            assert all(response_status == 401 for response_status, _, _ in rejected)
+
+        first_bytes = [(await call(app, "/stream", "valid"))[2] for _ in range(args.streams)]
+        print(f"  {'':<20} stream first byte p50 {percentile(first_bytes, 0.5) * 1e6:>7.1f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-request cost of the auth middleware, old and new.")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--chunks", type=int, default=5)
+    parser.add_argument("--chunk-delay", type=float, default=0.001)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,62 @@
+import argparse
+import asyncio
+import io
+import time
+from tools.ddl import parse_sql_dump, parse_ddl_statements, iter_sql_dump
+from tools.workers import shutdown_process_pool
+
+
+class DumpFile:
+    def __init__(self, data: bytes):
+        self._buffer = io.BytesIO(data)
+
+    async def read(self, size: int = -1) -> bytes:
+        return self._buffer.read(size)
+
+
+def make_dump(tables: int, columns: int, rows: int) -> str:
+    parts = []
+    for t in range(tables):
+        cols = ",\n".join(
+            f"    col_{c} {'integer NOT NULL' if c == 0 else 'character varying(64)'}" for c in range(columns)
+        )
+        parts.append(f"CREATE TABLE public.table_{t} (\n{cols}\n);\n")
+        if rows:
+            data = "\n".join("\t".join(str(r) for _ in range(columns)) for r in range(rows))
+            parts.append(f"COPY public.table_{t} FROM stdin;\n{data}\n\\.\n")
+    return "".join(parts)
+
+
+def report(name: str, elapsed: float, tables: int, size: int) -> None:
+    print(f"{name:<22} {elapsed * 1000:>10.1f} ms {tables / elapsed:>12.0f} tables/s {size / elapsed / 2**20:>9.1f} MiB/s")
+
+
+async def run(tables: int, columns: int, rows: int) -> None:
+    dump = make_dump(tables, columns, rows)
+    size = len(dump.encode())
+    print(f"dump: {tables} tables x {columns} columns, {rows} rows each, {size / 2**20:.1f} MiB")
+
+    started = time.perf_counter()
+    parsed = parse_sql_dump(dump)
+    report("regex (whole text)", time.perf_counter() - started, len(parsed), size)
+
+    statements = [part for part in dump.split("\n\\.\n") for part in part.split(";\n") if "CREATE TABLE" in part]
+    started = time.perf_counter()
+    parsed = parse_ddl_statements([statement + ";" for statement in statements], "postgres")
+    report("sqlglot (in-process)", time.perf_counter() - started, len(parsed), size)
+
+    started = time.perf_counter()
+    parsed = [table async for table in iter_sql_dump(DumpFile(dump.encode()), "postgresql")]
+    report("sqlglot (stream+pool)", time.perf_counter() - started, len(parsed), size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare DDL parsing throughput of the regex and sqlglot paths.")
+    parser.add_argument("--tables", type=int, default=2000)
+    parser.add_argument("--columns", type=int, default=12)
+    parser.add_argument("--rows", type=int, default=0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args.tables, args.columns, args.rows))
+    finally:
+        shutdown_process_pool()
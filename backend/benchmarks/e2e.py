@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+_workdir = tempfile.mkdtemp(prefix="bench-e2e-")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(_workdir, 'bench.db')}")
+os.environ.setdefault("SECRET_KEY", uuid.uuid4().hex)
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("VECTOR_STORE", "local")
+os.environ.setdefault("LOCAL_VECTOR_PATH", os.path.join(_workdir, "vectors"))
+os.environ.setdefault("SQL_CACHE_PATH", os.path.join(_workdir, "sql_cache.sqlite3"))
+
+import httpx  # noqa: E402
+from sqlalchemy import event, select  # noqa: E402
+from benchmarks.ddl_parse import make_dump  # noqa: E402
+from benchmarks.standins import FakeLLMProvider, FakeSMTP, FakeVectorStore  # noqa: E402
+from data.config import engine, new_session, UserOrm  # noqa: E402
+from model.chat import ChatRequest  # noqa: E402
+from service import chat, user as user_service  # noqa: E402
+from src.main import app  # noqa: E402
+from tools.llm import LLMRouter  # noqa: E402
+
+STAGES = {
+    "schema_load": "load_schema_snapshot",
+    "cache_lookup": "find_sql_in_pinecone",
+    "prompt": "build_prompt",
+    "validation": "validate_sql",
+    "persistence": "append_chat_messages",
+}
+
+
+class RoundTrips:
+    def __init__(self):
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args) -> None:
+        self.count += 1
+
+
+class StageProfiler:
+    def __init__(self):
+        self.times: dict[str, list[float]] = {stage: [] for stage in STAGES}
+        self.allocations: dict[str, list[int]] = {stage: [] for stage in STAGES}
+        self._originals = {}
+
+    def install(self) -> None:
+        for stage, name in STAGES.items():
+            original = getattr(chat, name)
+            self._originals[name] = original
+            setattr(chat, name, self._wrap(stage, original))
+
+    def uninstall(self) -> None:
+        for name, original in self._originals.items():
+            setattr(chat, name, original)
+
+    def _wrap(self, stage: str, fn):
+        times = self.times[stage]
+        allocations = self.allocations[stage]
+
+        def measure(started: float, before: int) -> None:
+            times.append(time.perf_counter() - started)
+            if tracemalloc.is_tracing():
+                allocations.append(tracemalloc.get_traced_memory()[1] - before)
+
+        def start() -> tuple[float, int]:
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+                return time.perf_counter(), tracemalloc.get_traced_memory()[0]
+            return time.perf_counter(), 0
+
+        if asyncio.iscoroutinefunction(fn):
+            async def wrapped(*args, **kwargs):
+                started, before = start()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    measure(started, before)
+        else:
+            def wrapped(*args, **kwargs):
+                started, before = start()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    measure(started, before)
+        return wrapped
+
+
+def quiet():
+    # The service logs every cache lookup and attempt; keep the benchmark output readable.
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def report(name: str, latencies: list[float], round_trips: list[int]) -> None:
+    print(
+        f"  {name:<14} n={len(latencies):<5}"
+        f" p50 {percentile(latencies, 0.50) * 1000:>8.1f} ms"
+        f"  p95 {percentile(latencies, 0.95) * 1000:>8.1f} ms"
+        f"  p99 {percentile(latencies, 0.99) * 1000:>8.1f} ms"
+        f"  db round trips/request {statistics.mean(round_trips):>5.1f}"
+    )
+
+
+async def sign_up(client: httpx.AsyncClient, smtp: FakeSMTP) -> dict:
+    email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+    credentials = {"email": email, "password": "bench-password"}
+    response = await client.post("/user/register", json=credentials)
+    response.raise_for_status()
+    response = await client.post("/user/verify-email", json={"email": email, "code": smtp.last_code(email)})
+    response.raise_for_status()
+    response = await client.post("/user/login", json=credentials)
+    response.raise_for_status()
+    return {"email": email, "headers": {"Authorization": f"Bearer {response.json()['token']}"}}
+
+
+async def run_size(client: httpx.AsyncClient, account: dict, user_model: UserOrm, tables: int, args,
+                   round_trips: RoundTrips) -> None:
+    db_name = f"bench_{tables}_{uuid.uuid4().hex[:6]}"
+    dump = make_dump(tables, args.columns, 0).encode()
+    started = time.perf_counter()
+    with quiet():
+        response = await client.post("/database", data={"db_name": db_name, "db_type": "postgresql"},
+                                     files={"file": ("dump.sql", dump)}, headers=account["headers"])
+    response.raise_for_status()
+    print(f"{tables} tables x {args.columns} columns: import {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    async def via_route(question: str) -> None:
+        response = await client.post(f"/database/{db_name}/chat", json={"content": question},
+                                     headers=account["headers"])
+        response.raise_for_status()
+
+    async def via_service(question: str) -> None:
+        await chat.sql_generation(ChatRequest(content=question), db_name, user_model)
+
+    scenarios = [
+        ("route miss", via_route, lambda i: f"count rows in table_{i % tables} run {i} {uuid.uuid4().hex[:6]}"),
+        ("route hit", via_route, lambda i: f"count rows in table_{i % tables}"),
+        ("service miss", via_service, lambda i: f"list col_0 of table_{i % tables} {uuid.uuid4().hex[:6]}"),
+        ("service hit", via_service, lambda i: f"count rows in table_{i % tables}"),
+    ]
+    # Warm the questions the hit scenarios repeat, so they measure the cached path only.
+    with quiet():
+        for i in range(min(args.requests, tables)):
+            await via_route(f"count rows in table_{i % tables}")
+
+    for name, call, question in scenarios:
+        latencies: list[float] = []
+        trips: list[int] = []
+        for i in range(args.requests):
+            before = round_trips.count
+            started = time.perf_counter()
+            with quiet():
+                await call(question(i))
+            latencies.append(time.perf_counter() - started)
+            trips.append(round_trips.count - before)
+        report(name, latencies, trips)
+
+    profiler = StageProfiler()
+    profiler.install()
+    tracemalloc.start()
+    try:
+        with quiet():
+            for i in range(args.alloc_requests):
+                await via_route(f"sum col_1 of table_{i % tables} {uuid.uuid4().hex[:6]}")
+                await via_route(f"count rows in table_{i % tables}")
+    finally:
+        tracemalloc.stop()
+        profiler.uninstall()
+    print(f"  {'stage':<14} {'calls':>6} {'mean ms':>9} {'mean KiB':>10} {'max KiB':>9}")
+    for stage in STAGES:
+        allocations = profiler.allocations[stage]
+        if not allocations:
+            continue
+        print(
+            f"  {stage:<14} {len(allocations):>6} {statistics.mean(profiler.times[stage]) * 1000:>9.2f}"
+            f" {statistics.mean(allocations) / 1024:>10.1f} {max(allocations) / 1024:>9.1f}"
+        )
+
+
+async def run(args) -> None:
+    llm = FakeLLMProvider(latency=args.llm_latency, invalid_rate=args.invalid_rate)
+    smtp = FakeSMTP(latency=args.smtp_latency)
+    chat.llm = LLMRouter([llm])
+    chat.vector_store = FakeVectorStore(latency=args.vector_latency)
+    user_service.send_email = smtp.send_email
+    round_trips = RoundTrips()
+
+    print(f"database {engine.url.render_as_string(hide_password=True)}, llm {args.llm_latency * 1000:.0f} ms, "
+          f"vector store {args.vector_latency * 1000:.0f} ms, smtp {args.smtp_latency * 1000:.0f} ms")
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            with quiet():
+                account = await sign_up(client, smtp)
+            async with new_session() as session:
+                user_model = (await session.execute(
+                    select(UserOrm).where(UserOrm.email == account["email"])
+                )).scalars().one()
+            for tables in args.sizes:
+                await run_size(client, account, user_model, tables, args, round_trips)
+    print(f"llm calls {llm.calls}, emails {len(smtp.outbox)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="End-to-end latency of the NL->SQL pipeline with local stand-ins. "
+                    "Runs on a throwaway SQLite file unless DATABASE_URL points elsewhere (e.g. a local Postgres)."
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 500, 2000])
+    parser.add_argument("--columns", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--alloc-requests", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--invalid-rate", type=float, default=0.0)
+    parser.add_argument("--vector-latency", type=float, default=0.005)
+    parser.add_argument("--smtp-latency", type=float, default=0.05)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,100 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import statistics
+import tempfile
+import time
+
+_workdir = tempfile.mkdtemp(prefix="bench-generation-")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+os.environ.setdefault("VECTOR_STORE", "local")
+os.environ.setdefault("LOCAL_VECTOR_PATH", os.path.join(_workdir, "vectors"))
+os.environ.setdefault("SQL_CACHE_PATH", os.path.join(_workdir, "sql_cache.sqlite3"))
+
+from service import chat  # noqa: E402
+from service.schema import SchemaSnapshot, TableSnapshot  # noqa: E402
+from tools.workers import shutdown_process_pool  # noqa: E402
+
+VALID_SQL = "SELECT name FROM users WHERE id = 1;"
+INVALID_SQL = "SELECT name FROM users WHERE (id = 1;"
+SNAPSHOT = SchemaSnapshot(
+    db_id=0, db_name="bench", db_type="postgresql",
+    tables=(TableSnapshot(name="users", columns=(("id", "INT"), ("name", "TEXT"))),),
+)
+
+
+class FakeLLM:
+    def __init__(self, latency: float, jitter: float, invalid_rate: float, rng: random.Random):
+        self.latency = latency
+        self.jitter = jitter
+        self.invalid_rate = invalid_rate
+        self.rng = rng
+        self.calls = 0
+
+    async def complete(self, db_type: str, messages: list[dict], temperature: float) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency * self.rng.lognormvariate(0, self.jitter))
+        return INVALID_SQL if self.rng.random() < self.invalid_rate else VALID_SQL
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_mode(mode: str, requests: int, concurrency: int, latency: float, jitter: float,
+                   invalid_rate: float, seed: int) -> None:
+    llm = FakeLLM(latency, jitter, invalid_rate, random.Random(seed))
+    generate = chat.SQL_GENERATION_MODES[mode]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    failures = 0
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            sql_query, _ = await generate(llm, "prompt", SNAPSHOT)
+            latencies.append(time.perf_counter() - started)
+            failures += sql_query is None
+
+    # The service logs every attempt; keep the benchmark output readable.
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(one() for _ in range(requests)))
+    print(
+        f"{mode:<12} p50 {percentile(latencies, 0.50) * 1000:>8.1f} ms"
+        f"  p95 {percentile(latencies, 0.95) * 1000:>8.1f} ms"
+        f"  p99 {percentile(latencies, 0.99) * 1000:>8.1f} ms"
+        f"  mean {statistics.mean(latencies) * 1000:>8.1f} ms"
+        f"  llm calls/request {llm.calls / requests:>5.2f}"
+        f"  failed {failures}"
+    )
+
+
+async def run(args) -> None:
+    print(f"{args.requests} requests, concurrency {args.concurrency}, latency {args.latency * 1000:.0f} ms "
+          f"(jitter {args.jitter}), invalid rate {args.invalid_rate:.0%}, "
+          f"{chat.SQL_CANDIDATES} candidates / {chat.MAX_SQL_ATTEMPTS} attempts")
+    for mode in args.modes:
+        await run_mode(mode, args.requests, args.concurrency, args.latency, args.jitter, args.invalid_rate, args.seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare latency of the sequential and speculative SQL generation modes.")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2, help="median completion latency, seconds")
+    parser.add_argument("--jitter", type=float, default=0.5, help="sigma of the log-normal latency factor")
+    parser.add_argument("--invalid-rate", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--modes", nargs="+", default=list(chat.SQL_GENERATION_MODES))
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    finally:
+        chat.vector_store.close()
+        chat.sql_cache.close()
+        shutdown_process_pool()
@@ -0,0 +1,91 @@
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+TABLE_RE = re.compile(r"^([\w.]+)\((.*)\)$")
+
+app = FastAPI(title="OpenAI-compatible stand-in")
+app.state.latency = 0.05
+app.state.token_delay = 0.0
+app.state.invalid_rate = 0.0
+app.state.rng = random.Random(0)
+app.state.requests = 0
+
+
+def answer(messages: list[dict], broken: bool = False) -> str:
+    prompt = next((m["content"] for m in reversed(messages) if "Task:" in m.get("content", "")), "")
+    schema, _, task = prompt.rpartition("Task:")
+    tables = [match.groups() for match in map(TABLE_RE.match, schema.splitlines()) if match]
+    if not tables:
+        return "SELECT 1;"
+
+    task_words = set(re.findall(r"\w+", task.lower()))
+    table, columns = next(
+        ((name, cols) for name, cols in tables if name.lower() in task_words or name.lower().rstrip("s") in task_words),
+        tables[-1],
+    )
+    column = columns.split(",")[0].split()[0] if columns.strip() else "*"
+    if broken:
+        return f"SELECT {column} FROM {table} WHERE ("
+    return f"SELECT {column} FROM {table};"
+
+
+def completion(model: str, content: str) -> dict:
+    return {
+        "id": f"chatcmpl-{app.state.requests}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+    }
+
+
+async def stream_chunks(model: str, content: str):
+    for token in re.findall(r"\S+\s*", content):
+        if app.state.token_delay:
+            await asyncio.sleep(app.state.token_delay)
+        chunk = {
+            "id": f"chatcmpl-{app.state.requests}",
+            "object": "chat.completion.chunk",
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.get("/v1/models")
+async def models() -> dict:
+    return {"object": "list", "data": [{"id": "stand-in", "object": "model"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    app.state.requests += 1
+    await asyncio.sleep(app.state.latency)
+    model = body.get("model", "stand-in")
+    content = answer(body.get("messages", []), broken=app.state.rng.random() < app.state.invalid_rate)
+    if body.get("stream"):
+        return StreamingResponse(stream_chunks(model, content), media_type="text/event-stream")
+    return completion(model, content)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve deterministic SQL completions for offline runs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds before each completion starts")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed tokens")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="share of deliberately broken SQL answers")
+    args = parser.parse_args()
+    app.state.latency = args.latency
+    app.state.token_delay = args.token_delay
+    app.state.invalid_rate = args.invalid_rate
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
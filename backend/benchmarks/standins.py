@@ -0,0 +1,71 @@
+import asyncio
+import random
+import re
+from typing import AsyncIterator
+from benchmarks.llm_server import answer
+from tools.llm import LLMProvider
+from tools.vector_store import VectorHit, VectorStore
+
+
+class FakeLLMProvider(LLMProvider):
+    def __init__(self, latency: float = 0.05, token_delay: float = 0.0, invalid_rate: float = 0.0, seed: int = 0):
+        super().__init__("fake", "stand-in")
+        self.latency = latency
+        self.token_delay = token_delay
+        self.invalid_rate = invalid_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    async def complete(self, model: str, messages: list[dict], temperature: float) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return answer(messages, broken=self.rng.random() < self.invalid_rate)
+
+    async def stream(self, model: str, messages: list[dict], temperature: float) -> AsyncIterator[str]:
+        content = await self.complete(model, messages, temperature)
+        for token in re.findall(r"\S+\s*", content):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield token
+
+
+class FakeVectorStore(VectorStore):
+    def __init__(self, latency: float = 0.01):
+        self.latency = latency
+        self.records: dict[str, dict] = {}
+
+    async def fetch(self, ids: list[str]) -> dict[str, dict]:
+        await asyncio.sleep(self.latency)
+        return {record_id: self.records[record_id] for record_id in ids if record_id in self.records}
+
+    async def search(self, text: str, top_k: int, metadata_filter: dict[str, str]) -> list[VectorHit]:
+        # Only exact repeats are found; semantic neighbours would make hit rates depend on the data set.
+        await asyncio.sleep(self.latency)
+        return [
+            VectorHit(id=record_id, score=1.0, fields=fields)
+            for record_id, fields in self.records.items()
+            if fields.get("chunk_text") == f"Query: {text}"
+            and all(fields.get(key) == value for key, value in metadata_filter.items())
+        ][:top_k]
+
+    async def upsert(self, records: list[dict]) -> None:
+        await asyncio.sleep(self.latency)
+        for record in records:
+            self.records[record["_id"]] = {key: value for key, value in record.items() if key != "_id"}
+
+
+class FakeSMTP:
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.outbox: list[tuple[str, str, str]] = []
+
+    async def send_email(self, to_email: str, subject: str, body: str) -> None:
+        await asyncio.sleep(self.latency)
+        self.outbox.append((to_email, subject, body))
+
+    def last_code(self, to_email: str) -> str | None:
+        for email, _, body in reversed(self.outbox):
+            if email == to_email:
+                match = re.search(r"\b\d{6}\b", body)
+                return match.group(0) if match else None
+        return None
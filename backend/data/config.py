@@ -1,22 +1,51 @@
-from sqlalchemy import ForeignKey, UniqueConstraint, DateTime, func, Text, String, Boolean
+from sqlalchemy import ForeignKey, UniqueConstraint, DateTime, func, Text, String, Boolean, Index, inspect, text
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import Mapped, mapped_column, declarative_base, relationship
+from tools.metrics import instrument_engine
 
 import os
+import uuid
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 engine = create_async_engine(DATABASE_URL)
+# Counts statements and DB time per HTTP request; see MetricsMiddleware.
+instrument_engine(engine)
 new_session = async_sessionmaker(engine, expire_on_commit=False)
 
 Base = declarative_base()
 
 
+def _create_missing_indexes(sync_conn):
+    # create_all only builds indexes together with new tables, so add indexes declared later on existing ones.
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+
+def _add_missing_columns(sync_conn):
+    # Same for columns added to existing models: create_all never alters a table that is already there.
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(sync_conn.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+            if not column.nullable:
+                ddl += " NOT NULL"
+            sync_conn.execute(text(ddl))
+
+
 async def create_tables():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_create_missing_indexes)
 
 
 async def delete_tables():
@@ -58,6 +87,10 @@ class DatabaseOrm(Base):
     user_id: Mapped[int] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     db_name: Mapped[str]
     db_type: Mapped[str] = mapped_column(String(20), nullable=False)
+    schema_version: Mapped[int] = mapped_column(default=0, server_default="0", nullable=False)
+    schema_hash: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    # Ids can be reused after a delete; the nonce keeps schema caches from serving a previous database's schema.
+    schema_nonce: Mapped[str | None] = mapped_column(String(32), nullable=True, default=lambda: uuid.uuid4().hex)
     tables: Mapped[list[TableOrm] | None] = relationship('TableOrm', back_populates='database', cascade="all, delete")
     user: Mapped['UserOrm'] = relationship('UserOrm', back_populates='databases')
     chat_history: Mapped[list['ChatHistoryOrm']] = relationship('ChatHistoryOrm', back_populates='database',
@@ -93,6 +126,10 @@ class EmailVerificationTokenOrm(Base):
 
 class ChatHistoryOrm(Base):
     __tablename__ = "chat_history"
+    __table_args__ = (
+        # Rows are inserted in chat order, so id is the chronological order and the only pagination key.
+        Index('ix_chat_history_database_id_id', 'database_id', 'id'),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     database_id: Mapped[int] = mapped_column(ForeignKey('databases.id', ondelete='CASCADE'), nullable=False)
@@ -5,3 +5,9 @@ class Database(BaseModel):
     db_name: str = Field(min_length=3)
     db_type: str = Field(..., pattern="^(postgresql|mysql|sqlite|mssql|oracle)$")
     model_config = ConfigDict(from_attributes=True)
+
+
+class DatabaseImport(Database):
+    tables: int = 0
+    columns: int = 0
+    elapsed_ms: float = 0
@@ -1,262 +1,501 @@
 import html
 from model.chat import Chat, ChatRequest
-from service import table as table_service
-from service import column as column_service
+from model.page import Page
 from service import database as db_service
-from service import user as user_service
-from g4f.client import AsyncClient
+from service.schema import SchemaSnapshot, SCHEMA_TOKEN_BUDGET, load_schema_snapshot, prune_schema, render_schema, schema_index
+from tools.dialect import dialect_map
+from tools.sql_cache import SqlCache
+from tools.vector_store import create_vector_store
+from tools.batch_writer import BatchWriter
+from tools.pagination import encode_cursor, decode_cursor
+from tools.singleflight import SingleFlight
+from tools.cache import TTLCache
+from tools.llm import LLMRouter, create_llm_router
+from tools.sql_validation import SCHEMA_MISSING, check_sql
+from tools.workers import get_process_pool
+from tools.metrics import LLM_ATTEMPTS, LLM_CALLS_SAVED, SINGLEFLIGHT_SHARED, SQL_CACHE_LOOKUPS, VALIDATION_FAILURES, stage, timed
 from fastapi import HTTPException, status
-import sqlglot
-import pinecone
+import asyncio
 import hashlib
-import json
 import os
 from dotenv import load_dotenv
 from data.config import new_session, UserOrm, ChatHistoryOrm, DatabaseOrm
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, insert
+from functools import partial
+from typing import AsyncIterator
 
 load_dotenv()
 
-dialect_map = {
-    "postgresql": "postgres",
-    "mysql": "mysql",
-    "sqlite": "sqlite",
-    "mssql": "tsql",
-    "duckdb": "duckdb"
-}
-
 
 async def generate_id(text: str) -> str:
     return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
 
 
-def calc_schema_id(tables, columns):
-    payload = json.dumps({"t": tables, "c": columns}, separators=(",", ":"))
-    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+vector_store = create_vector_store()
+llm = create_llm_router()
 
 
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+async def upsert_sql_records(records: list[dict]):
+    await vector_store.upsert(records)
+    print(f"[PINECONE] Сохранено записей: {len(records)}")
 
-pc = pinecone.Pinecone(api_key=PINECONE_API_KEY)
 
-index_name = "text-to-sql"
-if not pc.has_index(index_name):
-    pc.create_index_for_model(
-        name=index_name,
-        cloud="aws",
-        region="us-east-1",
-        embed={"model": "llama-text-embed-v2", "field_map": {"text": "chunk_text"}}
-    )
-index = pc.Index(index_name)
+generation_flight = SingleFlight()
 
+SQL_GENERATION_MODE = os.getenv("SQL_GENERATION_MODE", "sequential").lower()
+if SQL_GENERATION_MODE not in ("sequential", "speculative"):
+    raise RuntimeError(f"Unknown SQL_GENERATION_MODE: {SQL_GENERATION_MODE}")
+MAX_SQL_ATTEMPTS = int(os.getenv("MAX_SQL_ATTEMPTS", "3"))
+SQL_CANDIDATES = int(os.getenv("SQL_CANDIDATES", "3"))
+SQL_CANDIDATE_TEMPERATURES = [float(t) for t in os.getenv("SQL_CANDIDATE_TEMPERATURES", "0.2,0.5,0.8").split(",")]
 
-async def validate_sql_syntax(sql_query: str, dialect: str) -> bool:
-    try:
-        sqlglot.parse_one(sql_query, dialect=dialect)
-        return True
-    except Exception as e:
-        print(f"Ошибка SQL: {e}")
-        return False
-
-
-async def save_sql_to_pinecone(natural_query: str, sql_query: str, schema: dict, db_type: str):
-    tables = sorted(schema.get("tables", {}).keys())
-    columns = sorted(
-        f"{tbl}.{col_name}".lower()
-        for tbl, cols in schema.get("tables", {}).items()
-        for col in cols
-        for col_name in col.keys())
-    schema_id = calc_schema_id(tables, columns)
+CHAT_HISTORY_WRITE_BEHIND = os.getenv("CHAT_HISTORY_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+
+
+async def insert_chat_rows(rows: list[dict]):
+    async with new_session() as session:
+        # Buffered rows may outlive their database, so skip rows whose database was deleted meanwhile.
+        db_ids = {row["database_id"] for row in rows}
+        existing = set((await session.execute(select(DatabaseOrm.id).where(DatabaseOrm.id.in_(db_ids)))).scalars())
+        rows = [row for row in rows if row["database_id"] in existing]
+        if rows:
+            await session.execute(insert(ChatHistoryOrm), rows)
+        await session.commit()
+
+
+history_writer = BatchWriter(
+    name="history",
+    flush=insert_chat_rows,
+    max_batch=int(os.getenv("CHAT_HISTORY_BATCH", "500")),
+    interval=float(os.getenv("CHAT_HISTORY_INTERVAL", "0.5")),
+    max_queue=int(os.getenv("CHAT_HISTORY_BUFFER", "10000")),
+)
+
+vector_writer = BatchWriter(
+    name="pinecone",
+    flush=upsert_sql_records,
+    max_batch=int(os.getenv("VECTOR_WRITE_BATCH", "96")),
+    interval=float(os.getenv("VECTOR_WRITE_INTERVAL", "2")),
+)
+
+sql_cache = SqlCache(
+    path=os.getenv("SQL_CACHE_PATH", "sql_cache.sqlite3"),
+    maxsize=int(os.getenv("SQL_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("SQL_CACHE_TTL", str(7 * 24 * 3600))),
+    max_rows=int(os.getenv("SQL_CACHE_MAX_ROWS", "1000000")),
+)
+
+
+validation_cache = TTLCache(
+    maxsize=int(os.getenv("SQL_VALIDATION_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("SQL_VALIDATION_CACHE_TTL", "3600")),
+)
+
+
+@timed("validation")
+async def validate_sql(sql_query: str, snapshot: SchemaSnapshot) -> str | None:
+    dialect = resolve_dialect(snapshot.db_type)
+    key = (dialect, snapshot.cache_key, sql_query)
+    error = validation_cache.get(key)
+    if error is None:
+        loop = asyncio.get_running_loop()
+        schema_key = (dialect, snapshot.cache_key)
+        # Workers keep parsed schemas by key, so the columns are only pickled to a worker that lacks them.
+        error = await loop.run_in_executor(get_process_pool(), check_sql, sql_query, dialect, schema_key)
+        if error == SCHEMA_MISSING:
+            error = await loop.run_in_executor(
+                get_process_pool(), check_sql, sql_query, dialect, schema_key, schema_index(snapshot).columns
+            )
+        error = error or ""
+        validation_cache.set(key, error)
+    if error:
+        VALIDATION_FAILURES.labels("syntax" if error.startswith(("Syntax error", "Empty query")) else "schema").inc()
+        print(f"Ошибка SQL: {error}")
+    return error or None
+
+
+@timed("vector_write")
+async def save_sql_to_pinecone(natural_query: str, sql_query: str, schema: SchemaSnapshot):
+    db_type = schema.db_type
+    schema_id = schema.schema_id
     id_text = f"{db_type.lower()}|{schema_id}|{natural_query}"
 
+    query_id = await generate_id(id_text)
+    await sql_cache.set(query_id, sql_query)
+
     record = {
-        "_id": await generate_id(id_text),
+        "_id": query_id,
         "chunk_text": f"Query: {natural_query}",
         "sql": sql_query,
         "db_type": db_type.lower(),
         "schema_id": schema_id,
-        "tables": tables,
-        "columns": columns,
+        "tables": schema.table_names,
+        "columns": schema.column_keys,
     }
 
-    index.upsert_records(namespace="sql-namespace", records=[record])
-    print(f"[PINECONE] Сохранено: {natural_query} → {sql_query}")
+    await vector_writer.submit(record)
 
 
-async def find_sql_in_pinecone(natural_query: str, schema: dict, db_type: str, top_k: int = 5) -> str | None:
-    tables = sorted(schema.get("tables", {}).keys())
-    columns = sorted(
-        f"{tbl}.{col_name}".lower()
-        for tbl, cols in schema.get("tables", {}).items()
-        for col in cols
-        for col_name in col.keys()
-        )
+def _abandon(task: asyncio.Task) -> None:
+    # The task may already have failed; retrieve its exception so it is not reported as never retrieved.
+    task.cancel()
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
 
-    schema_id = calc_schema_id(tables, columns)
+@timed("cache_lookup")
+async def find_sql_in_pinecone(natural_query: str, schema: SchemaSnapshot, top_k: int = 5) -> str | None:
+    db_type = schema.db_type
+    schema_id = schema.schema_id
     id_text = f"{db_type.lower()}|{schema_id}|{natural_query}"
     query_id = await generate_id(id_text)
 
-    # by same id
-    by_id = index.fetch(ids=[query_id], namespace="sql-namespace")
-    if by_id and by_id.vectors and query_id in by_id.vectors:
-        vector_data = by_id.vectors[query_id]
-        meta = vector_data.metadata or {}
-        if meta.get("db_type") == db_type.lower():
-            sql = meta.get("sql")
-            if sql:
-                print("[PINECONE] Точное совпадение по ID найдено.")
-                return sql
-
-    filter_cond = {
-        "db_type": {"$eq": db_type.lower()},
-        "schema_id": {"$eq": schema_id}
-    }
+    cached_sql = await sql_cache.get(query_id)
+    if cached_sql:
+        print("[CACHE] Точное совпадение найдено локально.")
+        return cached_sql
 
-    # rerank
-    response = index.search(
-        namespace="sql-namespace",
-        query={
-            "top_k": top_k,
-            "inputs": {"text": natural_query},
-            "filter": filter_cond,
-        },
-        rerank={
-            "model": "bge-reranker-v2-m3",
-            "top_n": top_k,
-            "rank_fields": ["chunk_text"],
-        },
-    )
-
-    if not response or "result" not in response or not response["result"]["hits"]:
+    filter_cond = {"db_type": db_type.lower(), "schema_id": schema_id}
+
+    # by same id and semantic search, issued together
+    fetch_task = asyncio.create_task(vector_store.fetch([query_id]))
+    search_task = asyncio.create_task(vector_store.search(natural_query, top_k, filter_cond))
+
+    try:
+        by_id = await fetch_task
+    except asyncio.TimeoutError:
+        print("[PINECONE] Таймаут при поиске по ID.")
+        by_id = {}
+    except BaseException:
+        _abandon(search_task)
+        raise
+    meta = by_id.get(query_id) or {}
+    if meta.get("db_type") == db_type.lower() and meta.get("sql"):
+        print("[PINECONE] Точное совпадение по ID найдено.")
+        _abandon(search_task)
+        await sql_cache.set(query_id, meta["sql"])
+        SQL_CACHE_LOOKUPS.labels("vector_id").inc()
+        return meta["sql"]
+
+    try:
+        hits = await search_task
+    except asyncio.TimeoutError:
+        print("[PINECONE] Таймаут при семантическом поиске.")
+        SQL_CACHE_LOOKUPS.labels("miss").inc()
         return None
 
-    best_hit = max(response["result"]["hits"], key=lambda h: h["_score"])
-    if best_hit["_score"] < 0.90:
-        print(f"{best_hit['_score']} < 0,90")
+    if not hits:
+        SQL_CACHE_LOOKUPS.labels("miss").inc()
         return None
 
-    best_sql = best_hit["fields"]["sql"]
-    print(f"[PINECONE] Найден SQL (score {best_hit['_score']}) → {best_sql}")
+    best_hit = max(hits, key=lambda h: h.score)
+    if best_hit.score < vector_store.score_threshold:
+        print(f"{best_hit.score} < {vector_store.score_threshold}")
+        SQL_CACHE_LOOKUPS.labels("miss").inc()
+        return None
+
+    best_sql = best_hit.fields["sql"]
+    print(f"[PINECONE] Найден SQL (score {best_hit.score}) → {best_sql}")
+    # A semantic match answers a similar question, not this one; caching it under the exact key would pin it forever.
+    SQL_CACHE_LOOKUPS.labels("vector_search").inc()
     return best_sql
 
 
-async def add_message_to_chat_history(db_id: int, data: ChatRequest, sender: str) -> Chat | None:
-    try:
-        async with new_session() as session:
-            chat_dict = data.model_dump()
-            message_orm = ChatHistoryOrm(**chat_dict, sender=sender, database_id=db_id)
-            session.add(message_orm)
-            await session.flush()
-            await session.commit()
-            message = Chat.from_orm(message_orm)
-            return message
-    except AttributeError:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Some parameters do not exist")
-
-
-async def sql_generation(chat: ChatRequest, db_name: str, token: str) -> dict:
-    if not chat.content:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Request can not be empty!")
+@timed("history_write")
+async def append_chat_messages(db_id: int, messages: list[tuple[str, str]]) -> None:
+    # created_at is left to the column default, so every row gets its timestamp from the same clock.
+    rows = [{"database_id": db_id, "content": content, "sender": sender} for content, sender in messages]
+    if CHAT_HISTORY_WRITE_BEHIND and history_writer.running:
+        for row in rows:
+            await history_writer.submit(row)
+        return
 
-    db_model: DatabaseOrm = await db_service.get_db_model(token, db_name)
-    if not db_model:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Database not found!")
+    async with new_session() as session:
+        await session.execute(insert(ChatHistoryOrm), rows)
+        await session.commit()
 
-    db_id = db_model.id
-    db_type = db_model.db_type
 
-    result = {}
-    tables = await table_service.get_all_tables_from_db(db_name, token, None, None, None)
-    for table in tables:
-        columns = await column_service.get_all_columns_from_table(token, db_name, table.table_name, None, None, None)
-        result[table.table_name] = [{column.column_name: column.column_type} for column in columns]
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().split()).rstrip("?.!; ")
 
-    schema = {"tables": result}
 
-    similar_sql = await find_sql_in_pinecone(chat.content, schema, db_type)
-    if similar_sql:
-        print("Используем кешированный SQL")
-        await add_message_to_chat_history(db_id, ChatRequest(content=chat.content), sender="user")
-        await add_message_to_chat_history(db_id, ChatRequest(content=similar_sql), sender="system")
-        return {"sql": similar_sql, "schema": result}
+PROMPT_TEMPLATE = """You are an SQL-query generator.
 
-    client = AsyncClient()
-    prompt = f"""
-    You are an SQL-query generator.
+Rules:
+1. Return exactly ONE line with raw SQL. No line breaks, no comments, no text around it.
+2. Use only tables / columns that exist in the schema.
+3. Add joins or conditions ONLY if they are stated in the task.
+4. Follow the syntax of the target dialect.
 
-    Task: {chat.content}
+Example:
+Task → Get all names from table users
+Schema → users(id int, Namee text)
+Answer → SELECT Namee FROM users;
 
-    Schema (JSON): {schema}
+Dialect: {dialect}
 
-    Dialect: {db_type.upper()}
+Schema:
+{schema}
 
-    Rules:
-    1. Return exactly ONE line with raw SQL. No line breaks, no comments, no text around it.
-    2. Use only tables / columns that exist in the schema.
-    3. Add joins or conditions ONLY if they are stated in the task.
-    4. Follow the syntax of the target dialect.
+Task: """
 
-    Example:
-    Task → Get all names from table users
-    Schema → {{ "users": [{{"id":"int"}}, {{"Namee":"text"}}] }}
-    Answer → SELECT Namee FROM users;
+prompt_cache = TTLCache(
+    maxsize=int(os.getenv("PROMPT_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("PROMPT_CACHE_TTL", "3600")),
+)
 
-    Now answer for the Task above.
-    """.strip()
 
-    sql_query = None
+def build_prompt(question: str, snapshot: SchemaSnapshot) -> str:
+    index = schema_index(snapshot)
+    if index.tokens > SCHEMA_TOKEN_BUDGET:
+        schema = render_schema(prune_schema(snapshot, question), index)
+        return PROMPT_TEMPLATE.format(dialect=snapshot.db_type.upper(), schema=schema) + question
 
-    for attempt in range(1, 4):
-        print(f" Попытка {attempt}: Генерация SQL запроса...")
+    key = snapshot.cache_key
+    head = prompt_cache.get(key)
+    if head is None:
+        head = PROMPT_TEMPLATE.format(dialect=snapshot.db_type.upper(), schema=index.text)
+        prompt_cache.set(key, head)
+    return head + question
 
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            temperature=0.2,
-            messages=[
-                {"role": "system",
-                 "content": "You are a strict SQL generator. Answer with a single-line SQL query only."},
-                {"role": "user", "content": prompt}
-            ],
-            web_search=False
-        )
 
-        sql_query = html.unescape(response.choices[0].message.content.strip())
+def completion_messages(prompt: str) -> list[dict]:
+    return [
+        {"role": "system",
+         "content": "You are a strict SQL generator. Answer with a single-line SQL query only."},
+        {"role": "user", "content": prompt}
+    ]
 
-        sqlglot_dialect = dialect_map.get(db_type.lower())
 
-        if not sqlglot_dialect:
-            raise HTTPException(status_code=400, detail=f"Unsupported SQL dialect: {db_type}")
+def resolve_dialect(db_type: str) -> str:
+    sqlglot_dialect = dialect_map.get(db_type.lower())
+    if not sqlglot_dialect:
+        raise HTTPException(status_code=400, detail=f"Unsupported SQL dialect: {db_type}")
+    return sqlglot_dialect
 
-        is_valid = await validate_sql_syntax(sql_query, sqlglot_dialect)
 
-        if is_valid:
+def retry_messages(prompt: str, sql_query: str, error: str) -> list[dict]:
+    return completion_messages(prompt) + [
+        {"role": "assistant", "content": sql_query},
+        {"role": "user", "content": f"This query is invalid: {error}. Answer with a corrected single-line SQL query only."},
+    ]
+
+
+async def generate_sequential(llm: LLMRouter, prompt: str, snapshot: SchemaSnapshot) -> tuple[str | None, int]:
+    messages = completion_messages(prompt)
+    llm_calls = 0
+    for attempt in range(1, MAX_SQL_ATTEMPTS + 1):
+        print(f" Попытка {attempt}: Генерация SQL запроса...")
+
+        llm_calls += 1
+        LLM_ATTEMPTS.labels("sequential").inc()
+        with stage("llm"):
+            sql_query = await llm.complete(snapshot.db_type, messages, SQL_CANDIDATE_TEMPERATURES[0])
+
+        error = await validate_sql(sql_query, snapshot)
+        if error is None:
             print(f"SQL валиден на {attempt}-й попытке.")
-            break
+            return sql_query, llm_calls
 
         print(f"Попытка {attempt} не удалась. Пробуем снова...")
-        sql_query = None
+        # The next attempt sees why the previous answer was rejected instead of retrying blindly.
+        messages = retry_messages(prompt, sql_query, error)
+    return None, llm_calls
+
+
+async def _candidate(llm: LLMRouter, prompt: str, snapshot: SchemaSnapshot, temperature: float) -> str | None:
+    LLM_ATTEMPTS.labels("speculative").inc()
+    with stage("llm"):
+        sql_query = await llm.complete(snapshot.db_type, completion_messages(prompt), temperature)
+    return sql_query if await validate_sql(sql_query, snapshot) is None else None
+
+
+async def generate_speculative(llm: LLMRouter, prompt: str, snapshot: SchemaSnapshot) -> tuple[str | None, int]:
+    temperatures = [SQL_CANDIDATE_TEMPERATURES[i % len(SQL_CANDIDATE_TEMPERATURES)] for i in range(SQL_CANDIDATES)]
+    tasks = [asyncio.create_task(_candidate(llm, prompt, snapshot, t)) for t in temperatures]
+    try:
+        for number, finished in enumerate(asyncio.as_completed(tasks), start=1):
+            try:
+                sql_query = await finished
+            except Exception as e:
+                print(f"Кандидат завершился ошибкой: {e}")
+                continue
+            if sql_query:
+                print(f"SQL валиден: принят {number}-й из {len(tasks)} кандидатов.")
+                return sql_query, len(tasks)
+        return None, len(tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+SQL_GENERATION_MODES = {
+    "sequential": generate_sequential,
+    "speculative": generate_speculative,
+}
+
+
+async def resolve_sql(question: str, snapshot: SchemaSnapshot) -> dict:
+    similar_sql = await find_sql_in_pinecone(question, snapshot)
+    if similar_sql:
+        print("Используем кешированный SQL")
+        return {"sql": similar_sql, "llm_calls": 0}
+
+    with stage("prompt"):
+        prompt = build_prompt(question, snapshot)
+    generate = SQL_GENERATION_MODES[SQL_GENERATION_MODE]
+    sql_query, llm_calls = await generate(llm, prompt, snapshot)
 
     if sql_query is None:
         raise HTTPException(status_code=500, detail="Failed to generate a valid SQL query after multiple attempts")
 
-    await save_sql_to_pinecone(chat.content, sql_query, schema, db_type)
-    await add_message_to_chat_history(db_id, ChatRequest(content=chat.content), sender="user")
-    await add_message_to_chat_history(db_id, ChatRequest(content=sql_query), sender="system")
+    await save_sql_to_pinecone(question, sql_query, snapshot)
+    return {"sql": sql_query, "llm_calls": llm_calls}
+
+
+async def sql_generation(chat: ChatRequest, db_name: str, user_model: UserOrm) -> dict:
+    if not chat.content:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Request can not be empty!")
+
+    snapshot = await load_schema_snapshot(user_model, db_name)
+    if not snapshot:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Database not found!")
+    resolve_dialect(snapshot.db_type)
+
+    key = (snapshot.db_type.lower(), snapshot.schema_id, normalize_question(chat.content))
+    outcome, shared = await generation_flight.do(key, partial(resolve_sql, chat.content, snapshot))
+    if shared:
+        SINGLEFLIGHT_SHARED.inc()
+        LLM_CALLS_SAVED.inc(outcome["llm_calls"])
+        print(f"[SINGLEFLIGHT] Результат общей генерации переиспользован ({outcome['llm_calls']} LLM-вызовов сэкономлено)")
+
+    await append_chat_messages(snapshot.db_id, [(chat.content, "user"), (outcome["sql"], "system")])
+    return {"sql": outcome["sql"], "schema": snapshot.as_dict()}
+
+
+pending_writes: set[asyncio.Task] = set()
+
+
+def _report_persist_failure(task: asyncio.Task) -> None:
+    pending_writes.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        error = task.exception()
+        print(f"[STREAM] Не удалось сохранить результат генерации: {type(error).__name__}: {error}")
+
+
+def _persist_in_background(coro) -> None:
+    task = asyncio.create_task(coro)
+    pending_writes.add(task)
+    task.add_done_callback(_report_persist_failure)
+
+
+async def _persist_generation(question: str, sql_query: str, snapshot: SchemaSnapshot, generated: bool) -> None:
+    if generated:
+        await save_sql_to_pinecone(question, sql_query, snapshot)
+    await append_chat_messages(snapshot.db_id, [(question, "user"), (sql_query, "system")])
+
+
+async def _sql_events(question: str, snapshot: SchemaSnapshot) -> AsyncIterator[dict]:
+    # Headers are already sent, so a failure mid-stream has to reach the client as an event, not a status code.
+    try:
+        async for event in _generation_events(question, snapshot):
+            yield event
+    except Exception as e:
+        print(f"[STREAM] Генерация прервалась: {type(e).__name__}: {e}")
+        detail = e.detail if isinstance(e, HTTPException) else "SQL generation failed"
+        yield {"event": "error", "data": {"detail": detail}}
+
+
+async def _generation_events(question: str, snapshot: SchemaSnapshot) -> AsyncIterator[dict]:
+    result = snapshot.as_dict()
+
+    similar_sql = await find_sql_in_pinecone(question, snapshot)
+    yield {"event": "cache", "data": {"hit": similar_sql is not None}}
+    if similar_sql:
+        _persist_in_background(_persist_generation(question, similar_sql, snapshot, generated=False))
+        yield {"event": "sql", "data": {"sql": similar_sql, "schema": result}}
+        return
+
+    with stage("prompt"):
+        prompt = build_prompt(question, snapshot)
+    messages = completion_messages(prompt)
+
+    for attempt in range(1, MAX_SQL_ATTEMPTS + 1):
+        yield {"event": "attempt", "data": {"attempt": attempt}}
+        tokens = []
+        LLM_ATTEMPTS.labels("stream").inc()
+        async for token in llm.stream(snapshot.db_type, messages, SQL_CANDIDATE_TEMPERATURES[0]):
+            tokens.append(token)
+            yield {"event": "token", "data": {"token": token}}
+
+        sql_query = html.unescape("".join(tokens).strip())
+        error = await validate_sql(sql_query, snapshot)
+        yield {"event": "validation", "data": {"attempt": attempt, "valid": error is None, "error": error}}
+
+        if error is None:
+            print(f"SQL валиден на {attempt}-й попытке.")
+            # History and vector writes do not hold up the final event.
+            _persist_in_background(_persist_generation(question, sql_query, snapshot, generated=True))
+            yield {"event": "sql", "data": {"sql": sql_query, "schema": result}}
+            return
+
+        print(f"Попытка {attempt} не удалась. Пробуем снова...")
+        messages = retry_messages(prompt, sql_query, error)
+
+    yield {"event": "error", "data": {"detail": "Failed to generate a valid SQL query after multiple attempts"}}
+
+
+async def stream_sql_generation(chat: ChatRequest, db_name: str, user_model: UserOrm) -> AsyncIterator[dict]:
+    if not chat.content:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Request can not be empty!")
+
+    snapshot = await load_schema_snapshot(user_model, db_name)
+    if not snapshot:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Database not found!")
+    resolve_dialect(snapshot.db_type)
+
+    return _sql_events(chat.content, snapshot)
+
+
+async def get_chat_history_page(db_name: str, cursor: str | None, limit: int, user_model: UserOrm) -> Page[Chat]:
+    query = select(
+        ChatHistoryOrm.id, ChatHistoryOrm.content, ChatHistoryOrm.sender, ChatHistoryOrm.created_at
+    ).join(DatabaseOrm).where(
+        DatabaseOrm.db_name == db_name,
+        DatabaseOrm.user_id == user_model.id
+    ).order_by(ChatHistoryOrm.id).limit(limit + 1)
+
+    if cursor:
+        # Not keyed on created_at: one turn shares a timestamp, and SQLite compares it as text in another format.
+        values = decode_cursor(cursor)
+        if len(values) != 1 or type(values[0]) is not int:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        query = query.where(ChatHistoryOrm.id > values[0])
+
+    async with new_session() as session:
+        rows = (await session.execute(query)).all()
+
+    if not rows and not await db_service.get_db_id_if_exists(user_model, db_name):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Database not found!")
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].id)
 
-    return {"sql": sql_query, "schema": result}
+    items = [Chat(content=row.content, sender=row.sender, created_at=row.created_at) for row in rows]
+    return Page[Chat](items=items, next_cursor=next_cursor)
 
 
-async def get_chat_history(db_name, page, page_size, skip, token) -> list[Chat] | None:
-    user_model: UserOrm = await user_service.verify_token(token)
+async def get_chat_history(db_name, page, page_size, skip, user_model: UserOrm) -> list[Chat] | None:
     user_id = user_model.id
-    if not await db_service.get_db_id_if_exists(token, db_name):
+    if not await db_service.get_db_id_if_exists(user_model, db_name):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Database not found!")
 
     async with new_session() as session:
         query = select(ChatHistoryOrm).join(DatabaseOrm).where(
             DatabaseOrm.db_name == db_name,
             DatabaseOrm.user_id == user_id
-        ).order_by(ChatHistoryOrm.created_at)
+        ).order_by(ChatHistoryOrm.id)
 
         if page is not None and page_size is not None:
             offset = (page - 1) * page_size
@@ -269,11 +508,13 @@ async def get_chat_history(db_name, page, page_size, skip, token) -> list[Chat]
         return [Chat.from_orm(chat_model) for chat_model in chat_models]
 
 
-async def clear_chat_history(token: str, db_name: str) -> dict:
-    db_id = await db_service.get_db_id_if_exists(token, db_name)
+async def clear_chat_history(user_model: UserOrm, db_name: str) -> dict:
+    db_id = await db_service.get_db_id_if_exists(user_model, db_name)
     if not db_id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Non-existent Database")
 
+    # Buffered write-behind rows would otherwise land after the DELETE and bring cleared messages back.
+    await history_writer.flush()
     async with new_session() as session:
         await session.execute(
             delete(ChatHistoryOrm).where(ChatHistoryOrm.database_id == db_id)
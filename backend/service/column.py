@@ -1,54 +1,64 @@
 from data.config import new_session, ColumnOrm, TableOrm, DatabaseOrm, UserOrm
 from model.column import Column
-from service import user, table, database
+from model.page import Page
+from service import table, database, listing
+from service.schema import bump_schema_version
 from fastapi import HTTPException, status
 from sqlalchemy import select, exc
 from typing import Optional
+from tools.metrics import timed
 
 
-async def get_all_columns_from_table(token: str, db_name: str, table_name: str, page: Optional[int],
-                                     page_size: Optional[int],
-                                     skip: Optional[int]) -> list[Column] | None:
-    if not await database.get_db_id_if_exists(token, db_name):
+def _columns_query(user_model: UserOrm, db_name: str, table_name: str):
+    return select(ColumnOrm.column_name, ColumnOrm.column_type).join(TableOrm).join(DatabaseOrm).where(
+        TableOrm.table_name == table_name,
+        DatabaseOrm.db_name == db_name,
+        DatabaseOrm.user_id == user_model.id)
+
+
+async def _ensure_table_exists(user_model: UserOrm, db_name: str, table_name: str) -> None:
+    if not await database.get_db_id_if_exists(user_model, db_name):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Database not found!")
-    if not await table.table_exists(token, db_name, table_name):
+    if not await table.table_exists(user_model, db_name, table_name):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Table not found!")
 
+
+@timed("column_list")
+async def get_all_columns_from_table(user_model: UserOrm, db_name: str, table_name: str, page: Optional[int],
+                                     page_size: Optional[int],
+                                     skip: Optional[int]) -> list[Column] | None:
     try:
         if page is not None:
             skip = (page - 1) * page_size
-        if skip is None:
-            skip = 0
-
-        user_model: UserOrm = await user.verify_token(token)
-        user_id = user_model.id
-        async with new_session() as session:
-            if page_size is not None:
-                query = select(ColumnOrm).join(TableOrm).join(DatabaseOrm).where(TableOrm.table_name == table_name,
-                                                                                 DatabaseOrm.db_name == db_name,
-                                                                                 DatabaseOrm.user_id == user_id).offset(
-                    skip).limit(page_size)
-            else:
-                query = select(ColumnOrm).join(TableOrm).join(DatabaseOrm).where(TableOrm.table_name == table_name,
-                                                                                 DatabaseOrm.db_name == db_name,
-                                                                                 DatabaseOrm.user_id == user_id).offset(
-                    skip)
-            result = await session.execute(query)
-            column_models = result.scalars().all()
-            columns = [Column.from_orm(column_model) for column_model in column_models]
-            return columns
+        rows = await listing.offset_rows(_columns_query(user_model, db_name, table_name), ColumnOrm.id, skip,
+                                         page_size)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{e}")
 
+    if not rows:
+        await _ensure_table_exists(user_model, db_name, table_name)
+    return [Column.model_construct(column_name=row.column_name, column_type=row.column_type) for row in rows]
+
+
+@timed("column_list")
+async def get_columns_page(user_model: UserOrm, db_name: str, table_name: str, cursor: Optional[str],
+                           limit: int) -> Page[Column]:
+    rows, next_cursor = await listing.keyset_rows(_columns_query(user_model, db_name, table_name), ColumnOrm.id,
+                                                  cursor, limit)
+    if not rows:
+        await _ensure_table_exists(user_model, db_name, table_name)
+    items = [Column.model_construct(column_name=row.column_name, column_type=row.column_type) for row in rows]
+    return Page[Column](items=items, next_cursor=next_cursor)
+
 
-async def create_column_in_table(token: str, db_name: str, column: Column, table_name: str) -> Column | None:
-    if not await database.get_db_id_if_exists(token, db_name):
+@timed("column_create")
+async def create_column_in_table(user_model: UserOrm, db_name: str, column: Column, table_name: str) -> Column | None:
+    if not await database.get_db_id_if_exists(user_model, db_name):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Database not found!")
-    if not await table.table_exists(token, db_name, table_name):
+    if not await table.table_exists(user_model, db_name, table_name):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Table not found!")
 
     try:
-        user_model = await user.verify_token(token)
         user_id = user_model.id
         async with new_session() as session:
             query = select(TableOrm).join(DatabaseOrm).where(
@@ -61,6 +71,7 @@ async def create_column_in_table(token: str, db_name: str, column: Column, table
             column_model = ColumnOrm(**column_dict, table_id=table_model.id)
             session.add(column_model)
             await session.flush()
+            await bump_schema_version(session, table_model.database_id)
             await session.commit()
             column_model = Column.from_orm(column_model)
             return column_model
@@ -68,23 +79,26 @@ async def create_column_in_table(token: str, db_name: str, column: Column, table
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="This column exists in table!")
 
 
-async def delete_column(db_name: str, table_name: str, token: str, column_name: str) -> dict:
-    if not await database.get_db_id_if_exists(token, db_name):
+@timed("column_delete")
+async def delete_column(db_name: str, table_name: str, user_model: UserOrm, column_name: str) -> dict:
+    if not await database.get_db_id_if_exists(user_model, db_name):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Database not found!")
-    if not await table.table_exists(token, db_name, table_name):
+    if not await table.table_exists(user_model, db_name, table_name):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Table not found!")
-    user_model = await user.verify_token(token)
     user_id = user_model.id
     async with new_session() as session:
-        query = select(ColumnOrm).join(TableOrm).join(DatabaseOrm).where(DatabaseOrm.db_name == db_name,
-                                                                         DatabaseOrm.user_id == user_id,
-                                                                         TableOrm.table_name == table_name,
-                                                                         ColumnOrm.column_name == column_name
-                                                                         )
+        query = select(ColumnOrm, TableOrm.database_id).join(TableOrm).join(DatabaseOrm).where(
+            DatabaseOrm.db_name == db_name,
+            DatabaseOrm.user_id == user_id,
+            TableOrm.table_name == table_name,
+            ColumnOrm.column_name == column_name
+        )
         result = await session.execute(query)
-        column_model = result.scalars().first()
-        if column_model is None:
+        row = result.first()
+        if row is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Non-existent column!")
+        column_model, db_id = row
         await session.delete(column_model)
+        await bump_schema_version(session, db_id)
         await session.commit()
     return {"detail:": "Column deleted successfully!"}
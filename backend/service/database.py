@@ -1,122 +1,143 @@
-from sqlalchemy import select
-from data.config import new_session, DatabaseOrm, UserOrm
-from service import user
-from model.database import Database
+from sqlalchemy import select, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from data.config import new_session, DatabaseOrm, UserOrm, TableOrm, ColumnOrm
+from model.database import Database, DatabaseImport
+from model.page import Page
 from fastapi import HTTPException, status, UploadFile
 from sqlalchemy import exc
-from typing import Optional, Dict, List, Tuple
-import re
+from typing import Optional, List, Tuple, AsyncIterable
+import time
 from model.table import Table
 from model.column import Column
-from service.table import add_table_to_db
-from service.column import create_column_in_table
+from tools.ddl import iter_sql_dump
+from service import listing
+from service.schema import evict_schema
+from tools.metrics import timed
 
-CREATE_RE = re.compile(
-    r"CREATE TABLE\s+public\.(\w+)\s*\((.*?)\);",
-    re.DOTALL | re.IGNORECASE
-)
+IMPORT_BATCH_SIZE = 500
 
-SKIP_PREFIX = {"CONSTRAINT", "PRIMARY", "UNIQUE", "FOREIGN",
-               "CHECK", "EXCLUDE", "PARTITION", ")"}
 
+def _databases_query(user_model: UserOrm):
+    return select(DatabaseOrm.db_name, DatabaseOrm.db_type).where(DatabaseOrm.user_id == user_model.id)
 
-def _canon_type(raw: str) -> str:
-    t = re.sub(r"\(.*?\)", "", raw).upper().strip()
-    if t.startswith("CHARACTER"):
-        return "VARCHAR"
-    if t == "INTEGER":
-        return "INT"
-    return t
 
-
-def parse_sql_dump(sql: str) -> Dict[str, List[Tuple[str, str]]]:
-    tables: Dict[str, List[Tuple[str, str]]] = {}
-
-    for tbl_match in CREATE_RE.finditer(sql):
-        table_name, block = tbl_match.groups()
-        columns: List[Tuple[str, str]] = []
-
-        for raw in block.splitlines():
-            line = raw.strip().rstrip(",")
-
-            if not line or line.startswith("--"):
-                continue
-            first = line.split()[0].upper()
-            if first in SKIP_PREFIX:
-                continue
-
-            m = re.match(r'"?(?P<name>\w+)"?\s+(?P<rest>.+)', line)
-            if not m:
-                continue
-
-            col_name = m.group("name")
-            rest = m.group("rest")
-
-            toks = []
-            for tok in re.split(r"\s+", rest):
-                if tok.upper() in {"NOT", "NULL", "DEFAULT",
-                                   "PRIMARY", "REFERENCES", "UNIQUE",
-                                   "CHECK"}:
-                    break
-                toks.append(tok)
-            if not toks:
-                continue
-
-            base_type = _canon_type(" ".join(toks))
-            columns.append((col_name, base_type))
-
-        tables[table_name] = columns
-
-    return tables
-
-
-async def get_databases(token: str, page: Optional[int], page_size: int, skip: Optional[int]) -> list[Database] | None:
+@timed("database_list")
+async def get_databases(user_model: UserOrm, page: Optional[int], page_size: int, skip: Optional[int]) -> list[Database] | None:
     try:
         if page is not None:
             skip = (page - 1) * page_size
-        elif skip is None:
-            skip = 0
-        user_model: UserOrm = await user.verify_token(token)
-        user_id = user_model.id
-        async with new_session() as session:
-            query = select(DatabaseOrm).filter(DatabaseOrm.user_id == user_id).offset(skip).limit(page_size)
-            result = await session.execute(query)
-            databases_model = result.scalars().all()
-            databases = [Database.from_orm(database_model) for database_model in databases_model]
-            return databases
+        rows = await listing.offset_rows(_databases_query(user_model), DatabaseOrm.id, skip, page_size)
+        return [Database.model_construct(db_name=row.db_name, db_type=row.db_type) for row in rows]
     except Exception:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad request.")
 
 
-async def create_database(token: str, data: Database, file: UploadFile | None = None) -> Database | None:
+@timed("database_list")
+async def get_databases_page(user_model: UserOrm, cursor: Optional[str], limit: int) -> Page[Database]:
+    rows, next_cursor = await listing.keyset_rows(_databases_query(user_model), DatabaseOrm.id, cursor, limit)
+    items = [Database.model_construct(db_name=row.db_name, db_type=row.db_type) for row in rows]
+    return Page[Database](items=items, next_cursor=next_cursor)
+
+
+def _colliding(names) -> list[str]:
+    # Exact duplicates are caught before inserting; what still violates a unique constraint differs only in case.
+    folded: dict[str, list[str]] = {}
+    for name in names:
+        folded.setdefault(name.casefold(), []).append(name)
+    return sorted(name for group in folded.values() if len(group) > 1 for name in group)
+
+
+async def _insert_table_batch(session: AsyncSession, db_id: int,
+                              batch: List[Tuple[str, List[Tuple[str, str | None]]]], seen: set[str]) -> int:
+    table_rows = [{**Table(table_name=table_name).model_dump(), "database_id": db_id} for table_name, _ in batch]
+    try:
+        result = await session.execute(insert(TableOrm).returning(TableOrm.id, TableOrm.table_name), table_rows)
+    except exc.IntegrityError:
+        names = ", ".join(_colliding(seen)) or ", ".join(name for name, _ in batch)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"The dump defines conflicting tables: {names}")
+    table_ids = {row.table_name: row.id for row in result}
+
+    column_rows = [
+        {**Column(column_name=column_name, column_type=column_type).model_dump(), "table_id": table_ids[table_name]}
+        for table_name, columns in batch
+        for column_name, column_type in columns
+    ]
+    if column_rows:
+        try:
+            await session.execute(insert(ColumnOrm), column_rows)
+        except exc.IntegrityError:
+            conflicts = [
+                f"{table_name}({', '.join(names)})"
+                for table_name, columns in batch
+                if (names := _colliding(column_name for column_name, _ in columns))
+            ]
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"The dump defines conflicting columns: {'; '.join(conflicts) or 'unknown'}")
+    return len(column_rows)
+
+
+async def import_schema(session: AsyncSession, db_id: int,
+                        parsed_tables: AsyncIterable[Tuple[str, List[Tuple[str, str | None]]]]) -> Tuple[int, int]:
+    table_count = 0
+    column_count = 0
+    seen: set[str] = set()
+    batch: List[Tuple[str, List[Tuple[str, str | None]]]] = []
+
+    async for table_name, columns in parsed_tables:
+        if table_name in seen:
+            continue
+        column_names: set[str] = set()
+        for column_name, _ in columns:
+            if column_name in column_names:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                    detail=f"Column '{column_name}' is defined twice in table '{table_name}'")
+            column_names.add(column_name)
+        seen.add(table_name)
+        batch.append((table_name, columns))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            column_count += await _insert_table_batch(session, db_id, batch, seen)
+            table_count += len(batch)
+            batch = []
+
+    if batch:
+        column_count += await _insert_table_batch(session, db_id, batch, seen)
+        table_count += len(batch)
+
+    return table_count, column_count
+
+
+@timed("database_create")
+async def create_database(user_model: UserOrm, data: Database, file: UploadFile | None = None) -> DatabaseImport | None:
     try:
-        user_model: UserOrm = await user.verify_token(token)
+        started = time.perf_counter()
         user_id = user_model.id
+        table_count = 0
+        column_count = 0
 
         async with new_session() as session:
             database_dict = data.model_dump(exclude={"file"})
             database = DatabaseOrm(**database_dict, user_id=user_id)
             session.add(database)
-            await session.flush()
-            await session.commit()
-            database = Database.from_orm(database)
+            try:
+                await session.flush()
+            except exc.IntegrityError:
+                raise HTTPException(status_code=400, detail="You're trying to create database, which already exists.")
 
-        if file:
-            sql_text = (await file.read()).decode("utf-8")
-            parsed_tables = parse_sql_dump(sql_text)
+            if file:
+                table_count, column_count = await import_schema(session, database.id, iter_sql_dump(file, data.db_type))
 
-            for table_name, columns in parsed_tables.items():
-                table = Table(table_name=table_name)
-                await add_table_to_db(data.db_name, token, table)
+            await session.commit()
 
-                for column_name, column_type in columns:
-                    column = Column(column_name=column_name, column_type=column_type)
-                    await create_column_in_table(token, data.db_name, column, table_name)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if file:
+            print(f"[IMPORT] {data.db_name}: {table_count} tables, {column_count} columns in {elapsed_ms:.1f} ms")
 
-        return database
+        return DatabaseImport(db_name=database.db_name, db_type=database.db_type,
+                              tables=table_count, columns=column_count, elapsed_ms=round(elapsed_ms, 1))
 
-    except exc.IntegrityError:
-        raise HTTPException(status_code=400, detail="You're trying to create database, which already exists.")
+    except HTTPException:
+        raise
     except AttributeError:
         raise HTTPException(status_code=400, detail="Some parameters do not exist.")
     except Exception as e:
@@ -124,8 +145,7 @@ async def create_database(token: str, data: Database, file: UploadFile | None =
         raise HTTPException(status_code=400, detail=f"Unexpected error: {str(e)}")
 
 
-async def get_db_id_if_exists(token: str, db_name: str) -> int:
-    user_model = await user.verify_token(token)
+async def get_db_id_if_exists(user_model: UserOrm, db_name: str) -> int:
     user_id = user_model.id
     async with new_session() as session:
         query = select(DatabaseOrm).where(DatabaseOrm.user_id == user_id, DatabaseOrm.db_name == db_name)
@@ -136,8 +156,8 @@ async def get_db_id_if_exists(token: str, db_name: str) -> int:
         return database.id
 
 
-async def delete(token: str, db_name: str) -> dict:
-    user_model: UserOrm = await user.verify_token(token)
+@timed("database_delete")
+async def delete(user_model: UserOrm, db_name: str) -> dict:
     user_id = user_model.id
     async with new_session() as session:
         query = select(DatabaseOrm).where(DatabaseOrm.user_id == user_id, DatabaseOrm.db_name == db_name)
@@ -147,11 +167,11 @@ async def delete(token: str, db_name: str) -> dict:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Non-existent Database")
         await session.delete(db_model)
         await session.commit()
+    evict_schema(db_model.id)
     return {"detail": "Database deleted successful!"}
 
 
-async def get_db_model(token: str, db_name: str) -> DatabaseOrm | None:
-    user_model: UserOrm = await user.verify_token(token)
+async def get_db_model(user_model: UserOrm, db_name: str) -> DatabaseOrm | None:
     user_id = user_model.id
     async with new_session() as session:
         result = await session.execute(
@@ -0,0 +1,31 @@
+from sqlalchemy import Select
+from fastapi import HTTPException, status
+from data.config import new_session
+from tools.pagination import encode_cursor, decode_cursor
+from typing import Optional
+
+
+async def offset_rows(query: Select, pk, skip: Optional[int], limit: Optional[int]) -> list:
+    query = query.order_by(pk).offset(skip or 0)
+    if limit is not None:
+        query = query.limit(limit)
+    async with new_session() as session:
+        return (await session.execute(query)).all()
+
+
+async def keyset_rows(query: Select, pk, cursor: Optional[str], limit: int) -> tuple[list, str | None]:
+    query = query.add_columns(pk.label("_pk"))
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != 1 or not isinstance(values[0], int):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        query = query.where(pk > values[0])
+    query = query.order_by(pk).limit(limit + 1)
+
+    async with new_session() as session:
+        rows = (await session.execute(query)).all()
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1]._pk)
@@ -0,0 +1,287 @@
+from dataclasses import dataclass
+from functools import cached_property, lru_cache
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from data.config import new_session, DatabaseOrm, TableOrm, UserOrm
+from tools.cache import TTLCache
+from tools.metrics import timed
+from dotenv import load_dotenv
+import hashlib
+import json
+import os
+import re
+
+load_dotenv()
+
+SCHEMA_TOKEN_BUDGET = int(os.getenv("SCHEMA_TOKEN_BUDGET", "4000"))
+SCHEMA_MAX_COLUMNS = int(os.getenv("SCHEMA_MAX_COLUMNS", "60"))
+CHARS_PER_TOKEN = 4
+KEY_COLUMN_RE = re.compile(r"(\w*?)_?id", re.IGNORECASE)
+
+snapshot_cache = TTLCache(
+    maxsize=int(os.getenv("SCHEMA_SNAPSHOT_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("SCHEMA_SNAPSHOT_CACHE_TTL", "3600")),
+)
+
+schema_index_cache = TTLCache(
+    maxsize=int(os.getenv("SCHEMA_INDEX_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("SCHEMA_INDEX_CACHE_TTL", "3600")),
+)
+
+
+def calc_schema_id(tables, columns):
+    payload = json.dumps({"t": tables, "c": columns}, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+@dataclass(frozen=True)
+class TableSnapshot:
+    name: str
+    columns: tuple[tuple[str, str | None], ...]
+
+
+@dataclass(frozen=True)
+class SchemaSnapshot:
+    db_id: int
+    db_name: str
+    db_type: str
+    tables: tuple[TableSnapshot, ...]
+    version: int = 0
+    schema_hash: str | None = None
+    nonce: str | None = None
+
+    @property
+    def cache_key(self) -> tuple[int, str | None, int]:
+        return self.db_id, self.nonce, self.version
+
+    @cached_property
+    def table_names(self) -> list[str]:
+        return sorted(table.name for table in self.tables)
+
+    @cached_property
+    def column_keys(self) -> list[str]:
+        return sorted(
+            f"{table.name}.{column_name}".lower()
+            for table in self.tables
+            for column_name, _ in table.columns
+        )
+
+    @cached_property
+    def schema_id(self) -> str:
+        return self.schema_hash or calc_schema_id(self.table_names, self.column_keys)
+
+    def as_dict(self) -> dict[str, list[dict[str, str | None]]]:
+        return {
+            table.name: [{column_name: column_type} for column_name, column_type in table.columns]
+            for table in self.tables
+        }
+
+
+@lru_cache(maxsize=65536)
+def _identifier_tokens(name: str) -> frozenset[str]:
+    words = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", name)
+    return frozenset(_singular(word) for word in re.findall(r"[a-z0-9]+", words.lower()))
+
+
+def _singular(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith(("ses", "xes", "ches", "shes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+@lru_cache(maxsize=65536)
+def _matches(identifier: frozenset[str], question: frozenset[str]) -> int:
+    score = len(identifier & question)
+    # Partial words like "cust" for "customer" still count, but only for reasonably long stems.
+    score += sum(
+        1 for part in identifier - question
+        if len(part) >= 4 and any(word.startswith(part) or part.startswith(word) for word in question if len(word) >= 4)
+    )
+    return score
+
+
+def render_table(table: TableSnapshot) -> str:
+    columns = ", ".join(f"{name} {kind.lower()}" if kind else name for name, kind in table.columns)
+    return f"{table.name}({columns})"
+
+
+def _line_tokens(line: str) -> int:
+    return len(line) // CHARS_PER_TOKEN + 1
+
+
+def _foreign_keys(tables: tuple[TableSnapshot, ...]) -> dict[str, set[str]]:
+    # Dumps rarely keep FK constraints, so infer links from "<table>_id" style column names.
+    by_token: dict[str, str] = {}
+    for table in tables:
+        by_token.setdefault(_singular(table.name.split(".")[-1].lower()), table.name)
+
+    links: dict[str, set[str]] = {table.name: set() for table in tables}
+    for table in tables:
+        for column_name, _ in table.columns:
+            match = KEY_COLUMN_RE.fullmatch(column_name)
+            if not match or not match.group(1):
+                continue
+            target = by_token.get(_singular(match.group(1).lower()))
+            if target and target != table.name:
+                links[table.name].add(target)
+                links[target].add(table.name)
+    return links
+
+
+@dataclass(frozen=True)
+class SchemaIndex:
+    lines: dict[str, str]
+    widths: dict[str, int]
+    costs: dict[str, int]
+    links: dict[str, set[str]]
+    columns: dict[str, tuple[str, ...]]
+    text: str
+    tokens: int
+
+
+def schema_index(snapshot: SchemaSnapshot) -> SchemaIndex:
+    index = schema_index_cache.get(snapshot.cache_key)
+    if index is not None:
+        return index
+
+    lines = {table.name: render_table(table) for table in snapshot.tables}
+    costs = {name: _line_tokens(line) for name, line in lines.items()}
+    index = SchemaIndex(
+        lines=lines,
+        widths={table.name: len(table.columns) for table in snapshot.tables},
+        costs=costs,
+        links=_foreign_keys(snapshot.tables),
+        columns={table.name: tuple(name for name, _ in table.columns) for table in snapshot.tables},
+        text="\n".join(lines.values()),
+        tokens=sum(costs.values()),
+    )
+    schema_index_cache.set(snapshot.cache_key, index)
+    return index
+
+
+def render_schema(snapshot: SchemaSnapshot, index: SchemaIndex) -> str:
+    return "\n".join(
+        index.lines[table.name] if index.widths.get(table.name) == len(table.columns) else render_table(table)
+        for table in snapshot.tables
+    )
+
+
+def _prune_columns(table: TableSnapshot, question: frozenset[str], max_columns: int) -> TableSnapshot:
+    if len(table.columns) <= max_columns:
+        return table
+    ranked = sorted(
+        range(len(table.columns)),
+        key=lambda i: (
+            -_matches(_identifier_tokens(table.columns[i][0]), question),
+            not KEY_COLUMN_RE.fullmatch(table.columns[i][0]),
+            i,
+        ),
+    )
+    keep = sorted(ranked[:max_columns])
+    return TableSnapshot(name=table.name, columns=tuple(table.columns[i] for i in keep))
+
+
+def prune_schema(snapshot: SchemaSnapshot, question: str, token_budget: int = SCHEMA_TOKEN_BUDGET,
+                 max_columns: int = SCHEMA_MAX_COLUMNS) -> SchemaSnapshot:
+    index = schema_index(snapshot)
+    if index.tokens <= token_budget:
+        return snapshot
+
+    question_tokens = _identifier_tokens(question)
+    scores: dict[str, float] = {}
+    for table in snapshot.tables:
+        score = 3 * _matches(_identifier_tokens(table.name), question_tokens)
+        score += sum(_matches(_identifier_tokens(name), question_tokens) for name, _ in table.columns)
+        if score:
+            scores[table.name] = score
+
+    # Tables joined to a matched table are needed for the joins even when the question does not name them.
+    for name, score in list(scores.items()):
+        for neighbour in index.links[name]:
+            scores[neighbour] = max(scores.get(neighbour, 0), score / 2)
+
+    order = {table.name: i for i, table in enumerate(snapshot.tables)}
+    ranked = sorted(snapshot.tables, key=lambda t: (-scores.get(t.name, 0), order[t.name]))
+
+    kept: list[TableSnapshot] = []
+    used = 0
+    for table in ranked:
+        if kept and not scores.get(table.name) and scores:
+            break
+        pruned = _prune_columns(table, question_tokens, max_columns)
+        cost = index.costs[table.name] if pruned is table else _line_tokens(render_table(pruned))
+        table = pruned
+        if kept and used + cost > token_budget:
+            continue
+        kept.append(table)
+        used += cost
+
+    kept.sort(key=lambda t: order[t.name])
+    print(f"[SCHEMA] {snapshot.db_name}: в промпт отобрано {len(kept)} из {len(snapshot.tables)} таблиц (~{used} токенов)")
+    return SchemaSnapshot(db_id=snapshot.db_id, db_name=snapshot.db_name, db_type=snapshot.db_type, tables=tuple(kept),
+                          version=snapshot.version, schema_hash=snapshot.schema_id, nonce=snapshot.nonce)
+
+
+async def bump_schema_version(session: AsyncSession, db_id: int) -> None:
+    # Runs inside the writer's transaction, so the new version becomes visible together with the schema change.
+    await session.execute(
+        update(DatabaseOrm).where(DatabaseOrm.id == db_id)
+        .values(schema_version=DatabaseOrm.schema_version + 1, schema_hash=None)
+    )
+
+
+def evict_schema(db_id: int) -> None:
+    snapshot_cache.discard_where(lambda snapshot: snapshot.db_id == db_id)
+
+
+@timed("schema_load")
+async def load_schema_snapshot(user_model: UserOrm, db_name: str) -> SchemaSnapshot | None:
+    async with new_session() as session:
+        query = select(DatabaseOrm.id, DatabaseOrm.schema_nonce, DatabaseOrm.schema_version).where(
+            DatabaseOrm.user_id == user_model.id, DatabaseOrm.db_name == db_name
+        )
+        header = (await session.execute(query)).first()
+        if header is None:
+            return None
+        snapshot = snapshot_cache.get((header.id, header.schema_nonce, header.schema_version))
+        if snapshot is not None:
+            return snapshot
+
+        query = select(DatabaseOrm).options(
+            joinedload(DatabaseOrm.tables).joinedload(TableOrm.columns)
+        ).where(DatabaseOrm.id == header.id)
+        result = await session.execute(query)
+        db_model: DatabaseOrm | None = result.unique().scalars().first()
+        if db_model is None:
+            return None
+
+        tables = tuple(
+            TableSnapshot(
+                name=table_model.table_name,
+                columns=tuple(
+                    (column_model.column_name, column_model.column_type)
+                    for column_model in sorted(table_model.columns or [], key=lambda c: c.id)
+                ),
+            )
+            for table_model in sorted(db_model.tables or [], key=lambda t: t.id)
+        )
+        snapshot = SchemaSnapshot(db_id=db_model.id, db_name=db_model.db_name, db_type=db_model.db_type, tables=tables,
+                                  version=db_model.schema_version, schema_hash=db_model.schema_hash,
+                                  nonce=db_model.schema_nonce)
+
+        if db_model.schema_hash is None:
+            # Store the hash only if no writer bumped the version since this snapshot was read.
+            await session.execute(
+                update(DatabaseOrm)
+                .where(DatabaseOrm.id == db_model.id, DatabaseOrm.schema_version == db_model.schema_version)
+                .values(schema_hash=snapshot.schema_id)
+            )
+            await session.commit()
+
+    snapshot_cache.set(snapshot.cache_key, snapshot)
+    return snapshot
@@ -1,46 +1,50 @@
 from data.config import new_session
 from model.table import Table
-from data.config import TableOrm, DatabaseOrm
+from model.page import Page
+from data.config import TableOrm, DatabaseOrm, UserOrm
 from sqlalchemy import select, exc
-from service import user, database
+from service import database, listing
+from service.schema import bump_schema_version
 from fastapi import HTTPException, status
 from typing import Optional
+from tools.metrics import timed
 
 
-async def get_all_tables_from_db(db_name: str, token: str, page: Optional[int], page_size: Optional[int],
+def _tables_query(db_name: str, user_model: UserOrm):
+    return select(TableOrm.table_name).join(DatabaseOrm).where(DatabaseOrm.db_name == db_name,
+                                                               DatabaseOrm.user_id == user_model.id)
+
+
+@timed("table_list")
+async def get_all_tables_from_db(db_name: str, user_model: UserOrm, page: Optional[int], page_size: Optional[int],
                                  skip: Optional[int]) -> \
         list[Table] | None:
-    if not await database.get_db_id_if_exists(token, db_name):
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Database not found!")
-
     try:
         if page is not None:
             skip = (page - 1) * page_size
-        if skip is None:
-            skip = 0
-        user_model = await user.verify_token(token)
-        user_id = user_model.id
-        async with new_session() as session:
-            if page_size is not None:
-                query = select(TableOrm).join(DatabaseOrm).where(DatabaseOrm.db_name == db_name,
-                                                                 DatabaseOrm.user_id == user_id).offset(skip).limit(
-                    page_size)
-            else:
-                query = select(TableOrm).join(DatabaseOrm).where(DatabaseOrm.db_name == db_name,
-                                                                 DatabaseOrm.user_id == user_id).offset(skip)
-            result = await session.execute(query)
-            tabel_models = result.scalars().all()
-            tabels = [Table.from_orm(tabel_model) for tabel_model in tabel_models]
-            return tabels
+        rows = await listing.offset_rows(_tables_query(db_name, user_model), TableOrm.id, skip, page_size)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{e}")
 
+    if not rows and not await database.get_db_id_if_exists(user_model, db_name):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Database not found!")
+    return [Table.model_construct(table_name=row.table_name) for row in rows]
+
+
+@timed("table_list")
+async def get_tables_page(db_name: str, user_model: UserOrm, cursor: Optional[str], limit: int) -> Page[Table]:
+    rows, next_cursor = await listing.keyset_rows(_tables_query(db_name, user_model), TableOrm.id, cursor, limit)
+    if not rows and not await database.get_db_id_if_exists(user_model, db_name):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Database not found!")
+    items = [Table.model_construct(table_name=row.table_name) for row in rows]
+    return Page[Table](items=items, next_cursor=next_cursor)
+
 
-async def add_table_to_db(db_name: str, token: str, table: Table) -> Table | None:
-    if not await database.get_db_id_if_exists(token, db_name):
+@timed("table_create")
+async def add_table_to_db(db_name: str, user_model: UserOrm, table: Table) -> Table | None:
+    if not await database.get_db_id_if_exists(user_model, db_name):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Database not found!")
     try:
-        user_model = await user.verify_token(token)
         user_id = user_model.id
         async with new_session() as session:
 
@@ -52,6 +56,7 @@ async def add_table_to_db(db_name: str, token: str, table: Table) -> Table | Non
             new_table = TableOrm(**table_dict, database_id=database_model.id)
             session.add(new_table)
             await session.flush()
+            await bump_schema_version(session, database_model.id)
             await session.commit()
             new_table = Table.from_orm(new_table)
             return new_table
@@ -60,10 +65,10 @@ async def add_table_to_db(db_name: str, token: str, table: Table) -> Table | Non
                             detail="This table exists in database!")
 
 
-async def delete_table(db_name: str, table_name: str, token: str) -> dict:
-    if not await database.get_db_id_if_exists(token, db_name):
+@timed("table_delete")
+async def delete_table(db_name: str, table_name: str, user_model: UserOrm) -> dict:
+    if not await database.get_db_id_if_exists(user_model, db_name):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Database not found!")
-    user_model = await user.verify_token(token)
     user_id = user_model.id
     async with new_session() as session:
         query = select(TableOrm).join(DatabaseOrm).where(DatabaseOrm.db_name == db_name,
@@ -75,12 +80,12 @@ async def delete_table(db_name: str, table_name: str, token: str) -> dict:
         if table_model is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Non-existent table")
         await session.delete(table_model)
+        await bump_schema_version(session, table_model.database_id)
         await session.commit()
     return {"detail:": "Table deleted successfully!"}
 
 
-async def table_exists(token: str, db_name: str, table_name: str) -> bool:
-    user_model = await user.verify_token(token)
+async def table_exists(user_model: UserOrm, db_name: str, table_name: str) -> bool:
     user_id = user_model.id
     async with new_session() as session:
         query = select(TableOrm).join(DatabaseOrm).where(DatabaseOrm.user_id == user_id, DatabaseOrm.db_name == db_name,
@@ -1,14 +1,17 @@
 from datetime import datetime, timedelta
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, update
 from data.config import new_session, UserOrm, EmailVerificationTokenOrm
 from model.user import LoginRequest, User, Password
-import bcrypt
 import jwt
 import os
 from fastapi import HTTPException, status
 import secrets
 from tools.email import send_email
+from tools.cache import TTLCache
+from tools.passwords import hash_password, verify_password, needs_rehash
+from tools.metrics import PASSWORD_REHASHES
 import httpx
+import time
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
@@ -29,11 +32,10 @@ MICROSOFT_CLIENT_ID = os.getenv("MICROSOFT_CLIENT_ID")
 MICROSOFT_CLIENT_SECRET = os.getenv("MICROSOFT_CLIENT_SECRET")
 MICROSOFT_REDIRECT_URI = os.getenv("MICROSOFT_REDIRECT_URI")
 
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "4096"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "300"))
 
-def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed_password.decode('utf-8')
+token_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
 
 
 def create_jwt_token(data: dict):
@@ -63,19 +65,31 @@ async def create_email_verification_token(user_id: int) -> str:
     return code
 
 
+def invalidate_user(email: str) -> None:
+    token_cache.discard_where(lambda user_model: user_model.email == email)
+
+
 async def verify_token(token: str) -> UserOrm | None:
     try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        email = payload.get("sub")
+        if email is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid Token.")
+
+        user_model = token_cache.get(token)
+        if user_model is not None:
+            return user_model
+
         async with new_session() as session:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            email = payload.get("sub")
-            if email is None:
-                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid Token.")
             query = select(UserOrm).where(UserOrm.email == email)
             result = await session.execute(query)
             user_model = result.scalars().first()
             if user_model is None:
                 raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid Token.")
-            return user_model
+
+        expires_in = payload["exp"] - time.time() if "exp" in payload else None
+        token_cache.set(token, user_model, ttl=expires_in)
+        return user_model
     except jwt.exceptions.DecodeError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid Token.")
     except jwt.ExpiredSignatureError:
@@ -85,10 +99,11 @@ async def verify_token(token: str) -> UserOrm | None:
 async def register(data: LoginRequest) -> User:
     await is_email_exists(data)
 
+    hashed_password = await hash_password(data.password)
     async with new_session() as session:
         user_dict = {
             "email": data.email,
-            "hashed_password": hash_password(data.password)
+            "hashed_password": hashed_password
         }
 
         user = UserOrm(**user_dict)
@@ -118,12 +133,32 @@ async def find_user(user: LoginRequest) -> bool:
         query = select(UserOrm).where(UserOrm.email == user.email)
         result = await session.execute(query)
         user_model = result.scalars().first()
-        if user_model is None:
-            return False
-        if not user_model.is_verified:
-            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Email not verified")
-        user_data = User.from_orm(user_model)
-        return bcrypt.checkpw(user.password.encode('utf-8'), user_data.hashed_password.encode('utf-8'))
+    if user_model is None:
+        return False
+    if not user_model.is_verified:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Email not verified")
+    user_data = User.from_orm(user_model)
+    # The session is closed by now, so a queued bcrypt check does not hold a pooled connection.
+    if not await verify_password(user.password, user_data.hashed_password):
+        return False
+    if needs_rehash(user_data.hashed_password):
+        await rehash_password(user_model.id, user.password, user_data.hashed_password)
+    return True
+
+
+async def rehash_password(user_id: int, password: str, old_hash: str) -> None:
+    # The plain password is only at hand on login, so hashes move to a new BCRYPT_ROUNDS one sign-in at a time.
+    new_hash = await hash_password(password)
+    async with new_session() as session:
+        result = await session.execute(
+            update(UserOrm)
+            .where(UserOrm.id == user_id, UserOrm.hashed_password == old_hash)
+            .values(hashed_password=new_hash)
+        )
+        await session.commit()
+    if result.rowcount:
+        PASSWORD_REHASHES.inc()
+        print(f"[AUTH] Хеш пароля пользователя {user_id} обновлён под новую стоимость bcrypt")
 
 
 async def is_email_exists(user: LoginRequest):
@@ -133,6 +168,7 @@ async def is_email_exists(user: LoginRequest):
         user_model: UserOrm = result.scalars().first()
 
         if user_model and not user_model.is_verified:
+            invalidate_user(user_model.email)
             await session.execute(
                 delete(EmailVerificationTokenOrm).where(EmailVerificationTokenOrm.user_id == user_model.id)
             )
@@ -159,26 +195,26 @@ async def login(data: LoginRequest) -> dict | None:
     return {"token": token, "token_type": "bearer"}
 
 
-async def delete_account(password: Password, token: str) -> dict:
-    user_model = await verify_token(token)
+async def delete_account(password: Password, user_model: UserOrm) -> dict:
     if not user_model.is_oauth:
-        if not bcrypt.checkpw(password.password.encode('utf-8'), user_model.hashed_password.encode('utf-8')):
+        if not await verify_password(password.password, user_model.hashed_password):
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail="Incorrect password. Account deletion failed.")
+    invalidate_user(user_model.email)
     async with new_session() as session:
-        await session.delete(user_model)
-        await session.flush()
-        await session.commit()
+        user_orm = await session.get(UserOrm, user_model.id)
+        if user_orm is not None:
+            await session.delete(user_orm)
+            await session.flush()
+            await session.commit()
         return {"detail": "Your account has been deleted successfully."}
 
 
-async def checkme(token):
-    user_model = await verify_token(token)
+async def checkme(user_model: UserOrm):
     return {"detail": f"Hello! {user_model.email}"}
 
 
-async def get_profile(token: str) -> dict:
-    user_model: UserOrm = await verify_token(token)
+async def get_profile(user_model: UserOrm) -> dict:
     return {
         "id": user_model.id,
         "email": user_model.email,
@@ -219,6 +255,7 @@ async def verify_email_code(email: str, code: str) -> None:
         user_obj.is_verified = True
         await session.delete(token_obj)
         await session.commit()
+        invalidate_user(email)
 
 
 async def resend_verification_code(email: str) -> None:
@@ -1,10 +1,15 @@
 import uvicorn
+import asyncio
 from fastapi import FastAPI
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
 from data.config import create_tables, delete_tables
-from web import user, database, table, column, chat
+from web import user, database, table, column, chat, metrics
 from tools.middleware import AuthMiddleware
+from tools.metrics import MetricsMiddleware
+from tools.workers import shutdown_process_pool
+from tools.passwords import shutdown_password_pool
+from service.chat import vector_store, vector_writer, history_writer, pending_writes, llm, sql_cache, CHAT_HISTORY_WRITE_BEHIND
 from fastapi.middleware.cors import CORSMiddleware
 load_dotenv()
 
@@ -15,7 +20,18 @@ async def lifespan(app: FastAPI):
     # print("Database is empty")
     await create_tables()
     print("Database is ready")
+    vector_writer.start()
+    if CHAT_HISTORY_WRITE_BEHIND:
+        history_writer.start()
     yield
+    await asyncio.gather(*pending_writes, return_exceptions=True)
+    await history_writer.stop()
+    await vector_writer.stop()
+    shutdown_process_pool()
+    shutdown_password_pool()
+    vector_store.close()
+    sql_cache.close()
+    await llm.close()
     print("Shutdown")
 
 
@@ -33,10 +49,13 @@ app.add_middleware(
 )
 
 app.add_middleware(AuthMiddleware)
+# Outermost, so Server-Timing and request latency cover auth and CORS as well.
+app.add_middleware(MetricsMiddleware)
 app.include_router(user.router)
 app.include_router(database.router)
 app.include_router(table.router)
 app.include_router(column.router)
 app.include_router(chat.router)
+app.include_router(metrics.router)
 if __name__ == '__main__':
     uvicorn.run("main:app", reload=True)
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import tempfile
+import uuid
+from datetime import datetime
+
+_workdir = tempfile.mkdtemp(prefix="test-chat-")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(_workdir, 'test.db')}")
+os.environ.setdefault("SECRET_KEY", uuid.uuid4().hex)
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("VECTOR_STORE", "local")
+os.environ.setdefault("LOCAL_VECTOR_PATH", os.path.join(_workdir, "vectors"))
+os.environ.setdefault("SQL_CACHE_PATH", os.path.join(_workdir, "sql_cache.sqlite3"))
+
+import pytest  # noqa: E402
+from fastapi import HTTPException  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+from data.config import create_tables, new_session, ChatHistoryOrm, DatabaseOrm, UserOrm  # noqa: E402
+from service.chat import get_chat_history_page  # noqa: E402
+from tools.pagination import encode_cursor  # noqa: E402
+
+
+async def _seed_turn() -> UserOrm:
+    await create_tables()
+    async with new_session() as session:
+        user_model = UserOrm(email=f"{uuid.uuid4().hex}@example.com", hashed_password="x", is_verified=True)
+        session.add(user_model)
+        await session.flush()
+        db_model = DatabaseOrm(user_id=user_model.id, db_name="shop", db_type="postgresql")
+        session.add(db_model)
+        await session.flush()
+        # Both messages of a turn get the same timestamp from the column default.
+        created_at = datetime(2026, 10, 18, 3, 36, 26)
+        await session.execute(insert(ChatHistoryOrm), [
+            {"database_id": db_model.id, "content": "how many orders?", "sender": "user", "created_at": created_at},
+            {"database_id": db_model.id, "content": "SELECT count(*) FROM orders", "sender": "system",
+             "created_at": created_at},
+        ])
+        await session.commit()
+    return user_model
+
+
+def test_rows_with_the_same_timestamp_are_split_across_pages():
+    async def scenario():
+        user_model = await _seed_turn()
+        first = await get_chat_history_page("shop", None, 1, user_model)
+        second = await get_chat_history_page("shop", first.next_cursor, 1, user_model)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert [item.sender for item in first.items] == ["user"]
+    assert first.next_cursor is not None
+    assert [item.sender for item in second.items] == ["system"]
+    assert second.next_cursor is None
+
+
+@pytest.mark.parametrize("cursor", [encode_cursor("2026-10-18T03:36:26", 1), encode_cursor("1"), encode_cursor(True)])
+def test_malformed_cursors_are_rejected(cursor):
+    async def scenario():
+        user_model = await _seed_turn()
+        await get_chat_history_page("shop", cursor, 1, user_model)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(scenario())
+    assert error.value.status_code == 400
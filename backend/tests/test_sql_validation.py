@@ -0,0 +1,40 @@
+import pytest
+from tools.sql_validation import SCHEMA_MISSING, check_sql
+
+COLUMNS = {"users": ("id", "Name"), "audit.Log": ("msg", "CreatedAt")}
+
+
+@pytest.mark.parametrize("sql_query", [
+    'SELECT "Name" FROM users',
+    'SELECT u."Name" FROM users AS u',
+    'SELECT msg FROM "Log"',
+    'SELECT msg, "CreatedAt" FROM "audit"."Log"',
+    'SELECT l.msg FROM audit."Log" AS l JOIN users ON users.id = 1',
+])
+def test_quoted_mixed_case_identifiers_resolve(sql_query):
+    assert check_sql(sql_query, "postgres", columns=COLUMNS) is None
+
+
+@pytest.mark.parametrize("sql_query, error", [
+    ("SELECT Name FROM users", "Column 'name' could not be resolved"),
+    ("SELECT msg FROM audit.log", "Unknown table(s): log"),
+    ('SELECT createdat FROM "audit"."Log"', "Column 'createdat' could not be resolved"),
+])
+def test_unquoted_identifiers_fold_before_matching(sql_query, error):
+    assert check_sql(sql_query, "postgres", columns=COLUMNS).startswith(error)
+
+
+def test_dialect_case_rules_apply():
+    assert check_sql("SELECT name FROM USERS", "tsql", columns=COLUMNS) is None
+    assert check_sql("SELECT `Name` FROM `users`", "mysql", columns=COLUMNS) is None
+
+
+def test_schema_is_cached_per_worker_by_key():
+    key = ("postgres", ("test", 1))
+    assert check_sql('SELECT "Name" FROM users', "postgres", key) == SCHEMA_MISSING
+    assert check_sql('SELECT "Name" FROM users', "postgres", key, COLUMNS) is None
+    assert check_sql("SELECT nope FROM users", "postgres", key).startswith("Column 'nope'")
+
+
+def test_syntax_errors_do_not_need_a_schema():
+    assert check_sql("SELECT FROM WHERE (", "postgres").startswith("Syntax error")
@@ -0,0 +1,106 @@
+from typing import Any, Awaitable, Callable
+import asyncio
+
+_STOP = object()
+
+
+def _release(barrier: asyncio.Future) -> None:
+    if not barrier.done():
+        barrier.set_result(None)
+
+
+class BatchWriter:
+    def __init__(self, name: str, flush: Callable[[list], Awaitable[Any]], max_batch: int = 100,
+                 interval: float = 1.0, max_queue: int = 10000, max_retries: int = 3, backoff: float = 0.5):
+        self.name = name
+        self.max_batch = max_batch
+        self.interval = interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.flushed = 0
+        self.batches = 0
+        self.dropped = 0
+        self._flush = flush
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run(), name=f"batch-writer-{self.name}")
+
+    async def submit(self, item: Any) -> None:
+        if not self.running:
+            await self._flush_with_retry([item])
+            return
+        await self._queue.put(item)
+
+    async def flush(self) -> None:
+        # Waits until everything submitted so far is written; the queue is FIFO, so a barrier item is enough.
+        if not self.running:
+            return
+        barrier = asyncio.get_running_loop().create_future()
+        await self._queue.put(barrier)
+        await barrier
+
+    async def stop(self) -> None:
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            if isinstance(item, asyncio.Future):
+                _release(item)
+                continue
+            batch = [item]
+            stopping = False
+            barrier = None
+            deadline = loop.time() + self.interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                if isinstance(item, asyncio.Future):
+                    barrier = item
+                    break
+                batch.append(item)
+
+            await self._flush_with_retry(batch)
+            if barrier is not None:
+                _release(barrier)
+            if stopping:
+                return
+
+    async def _flush_with_retry(self, batch: list) -> None:
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                await self._flush(batch)
+                self.flushed += len(batch)
+                self.batches += 1
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.dropped += len(batch)
+                    print(f"[{self.name.upper()}] Не удалось записать {len(batch)} записей: {e}")
+                    return
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
@@ -0,0 +1,235 @@
+from fastapi import UploadFile
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from typing import Dict, List, Tuple, AsyncIterator
+from tools.dialect import dialect_map
+from tools.workers import get_process_pool, PROCESS_POOL_WORKERS
+from collections import deque
+import asyncio
+import codecs
+import re
+import sqlglot
+
+CREATE_RE = re.compile(
+    r"CREATE TABLE\s+public\.(\w+)\s*\((.*?)\);",
+    re.DOTALL | re.IGNORECASE
+)
+
+SKIP_PREFIX = {"CONSTRAINT", "PRIMARY", "UNIQUE", "FOREIGN",
+               "CHECK", "EXCLUDE", "PARTITION", ")"}
+
+STATEMENT_PREFIX = ("CREATE ", "INSERT ", "ALTER ", "DROP ", "COPY ", "SET ")
+
+DEFAULT_SCHEMAS = {"public", "dbo", "main"}
+
+READ_CHUNK_SIZE = 1024 * 1024
+MAX_LINE_LENGTH = 64 * 1024
+MAX_STATEMENT_LENGTH = 4 * 1024 * 1024
+PARSE_BATCH_SIZE = 50
+PARSE_BATCH_LENGTH = 1024 * 1024
+
+
+def _canon_type(raw: str) -> str:
+    t = re.sub(r"\(.*?\)", "", raw).upper().strip()
+    if t.startswith("CHARACTER"):
+        return "VARCHAR"
+    if t == "INTEGER":
+        return "INT"
+    return t
+
+
+def _parse_columns(block: str) -> List[Tuple[str, str]]:
+    columns: List[Tuple[str, str]] = []
+
+    for raw in block.splitlines():
+        line = raw.strip().rstrip(",")
+
+        if not line or line.startswith("--"):
+            continue
+        first = line.split()[0].upper()
+        if first in SKIP_PREFIX:
+            continue
+
+        m = re.match(r'"?(?P<name>\w+)"?\s+(?P<rest>.+)', line)
+        if not m:
+            continue
+
+        col_name = m.group("name")
+        rest = m.group("rest")
+
+        toks = []
+        for tok in re.split(r"\s+", rest):
+            if tok.upper() in {"NOT", "NULL", "DEFAULT",
+                               "PRIMARY", "REFERENCES", "UNIQUE",
+                               "CHECK"}:
+                break
+            toks.append(tok)
+        if not toks:
+            continue
+
+        base_type = _canon_type(" ".join(toks))
+        columns.append((col_name, base_type))
+
+    return columns
+
+
+def parse_sql_dump(sql: str) -> Dict[str, List[Tuple[str, str]]]:
+    tables: Dict[str, List[Tuple[str, str]]] = {}
+
+    for tbl_match in CREATE_RE.finditer(sql):
+        table_name, block = tbl_match.groups()
+        tables[table_name] = _parse_columns(block)
+
+    return tables
+
+
+def _table_name(table: exp.Table) -> str:
+    if table.db and table.db.lower() not in DEFAULT_SCHEMAS:
+        return f"{table.db}.{table.name}"
+    return table.name
+
+
+def parse_ddl_statements(statements: List[str], dialect: str | None) -> List[Tuple[str, List[Tuple[str, str | None]]]]:
+    tables: List[Tuple[str, List[Tuple[str, str | None]]]] = []
+
+    for statement in statements:
+        try:
+            expressions = sqlglot.parse(statement, read=dialect)
+        except SqlglotError:
+            for tbl_match in CREATE_RE.finditer(statement):
+                table_name, block = tbl_match.groups()
+                tables.append((table_name, _parse_columns(block)))
+            continue
+
+        for expression in expressions:
+            if not isinstance(expression, exp.Create) or expression.args.get("kind") != "TABLE":
+                continue
+            schema = expression.this
+            if not isinstance(schema, exp.Schema) or not isinstance(schema.this, exp.Table):
+                continue
+
+            columns: List[Tuple[str, str | None]] = []
+            for column_def in schema.expressions:
+                if isinstance(column_def, exp.Identifier):
+                    columns.append((column_def.name, None))
+                    continue
+                if not isinstance(column_def, exp.ColumnDef):
+                    continue
+                kind = column_def.args.get("kind")
+                column_type = _canon_type(kind.sql(dialect=dialect)) if kind else None
+                columns.append((column_def.name, column_type))
+
+            tables.append((_table_name(schema.this), columns))
+
+    return tables
+
+
+def _clip_line(line: str) -> str:
+    # Only the start and the end of a line matter for skipping data, so keep memory bounded on huge lines.
+    if len(line) <= MAX_LINE_LENGTH:
+        return line
+    half = MAX_LINE_LENGTH // 2
+    return line[:half] + line[-half:]
+
+
+async def _iter_lines(file: UploadFile, chunk_size: int = READ_CHUNK_SIZE) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+
+    while True:
+        chunk = await file.read(chunk_size)
+        text = decoder.decode(chunk, final=not chunk)
+        parts = text.split("\n")
+        parts[0] = pending + parts[0]
+        for line in parts[:-1]:
+            yield _clip_line(line.rstrip("\r"))
+        pending = _clip_line(parts[-1])
+        if not chunk:
+            break
+
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_create_statements(file: UploadFile, chunk_size: int = READ_CHUNK_SIZE) -> AsyncIterator[str]:
+    statement: List[str] = []
+    statement_length = 0
+    in_copy = False
+    in_insert = False
+
+    async for line in _iter_lines(file, chunk_size):
+        if in_copy:
+            if line == "\\.":
+                in_copy = False
+            continue
+
+        stripped = line.strip()
+        head = stripped[:64].upper()
+        if in_insert:
+            if head == "GO" or stripped.endswith(";"):
+                in_insert = False
+                continue
+            if not head.startswith(STATEMENT_PREFIX):
+                continue
+            # T-SQL scripts may omit the terminator, so a new statement also ends the INSERT.
+            in_insert = False
+
+        if not statement:
+            if head.startswith("COPY "):
+                in_copy = "FROM STDIN" in stripped.upper()
+                continue
+            if head.startswith("INSERT "):
+                in_insert = not stripped.endswith(";")
+                continue
+            if not head.startswith("CREATE ") or " TABLE " not in f"{head} ":
+                continue
+
+        if head == "GO":
+            yield "\n".join(statement)
+            statement = []
+            statement_length = 0
+            continue
+
+        statement.append(line)
+        statement_length += len(line)
+        if statement_length > MAX_STATEMENT_LENGTH:
+            statement = []
+            statement_length = 0
+            continue
+
+        if stripped.endswith(";"):
+            yield "\n".join(statement)
+            statement = []
+            statement_length = 0
+
+    if statement:
+        yield "\n".join(statement)
+
+
+async def iter_sql_dump(file: UploadFile, db_type: str,
+                        chunk_size: int = READ_CHUNK_SIZE) -> AsyncIterator[Tuple[str, List[Tuple[str, str | None]]]]:
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+    dialect = dialect_map.get(db_type.lower())
+    parsing: deque[asyncio.Future] = deque()
+    batch: List[str] = []
+    batch_length = 0
+
+    async for statement in iter_create_statements(file, chunk_size):
+        batch.append(statement)
+        batch_length += len(statement)
+        if len(batch) < PARSE_BATCH_SIZE and batch_length < PARSE_BATCH_LENGTH:
+            continue
+
+        parsing.append(loop.run_in_executor(pool, parse_ddl_statements, batch, dialect))
+        batch = []
+        batch_length = 0
+        if len(parsing) > PROCESS_POOL_WORKERS:
+            for table in await parsing.popleft():
+                yield table
+
+    if batch:
+        parsing.append(loop.run_in_executor(pool, parse_ddl_statements, batch, dialect))
+    while parsing:
+        for table in await parsing.popleft():
+            yield table
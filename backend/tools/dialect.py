@@ -0,0 +1,7 @@
+dialect_map = {
+    "postgresql": "postgres",
+    "mysql": "mysql",
+    "sqlite": "sqlite",
+    "mssql": "tsql",
+    "duckdb": "duckdb"
+}
@@ -0,0 +1,240 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import AsyncIterator
+import asyncio
+import html
+import inspect
+import json
+import os
+import time
+import httpx
+
+
+class LLMProvider(ABC):
+    def __init__(self, name: str, model: str, dialect_models: dict[str, str] | None = None, timeout: float = 60.0):
+        self.name = name
+        self.model = model
+        self.dialect_models = dialect_models or {}
+        self.timeout = timeout
+
+    def model_for(self, db_type: str) -> str:
+        return self.dialect_models.get(db_type.lower(), self.model)
+
+    @abstractmethod
+    async def complete(self, model: str, messages: list[dict], temperature: float) -> str:
+        ...
+
+    @abstractmethod
+    def stream(self, model: str, messages: list[dict], temperature: float) -> AsyncIterator[str]:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+
+class G4FProvider(LLMProvider):
+    def __init__(self, name: str, model: str, dialect_models: dict[str, str] | None = None, timeout: float = 60.0):
+        super().__init__(name, model, dialect_models, timeout)
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            from g4f.client import AsyncClient
+
+            self._client = AsyncClient()
+        return self._client
+
+    async def complete(self, model: str, messages: list[dict], temperature: float) -> str:
+        response = await self._get_client().chat.completions.create(
+            model=model,
+            temperature=temperature,
+            messages=messages,
+            web_search=False
+        )
+        return response.choices[0].message.content
+
+    async def stream(self, model: str, messages: list[dict], temperature: float) -> AsyncIterator[str]:
+        response = self._get_client().chat.completions.create(
+            model=model,
+            temperature=temperature,
+            messages=messages,
+            web_search=False,
+            stream=True,
+        )
+        if inspect.isawaitable(response):
+            response = await response
+        async for chunk in response:
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if token:
+                yield token
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    def __init__(self, name: str, base_url: str, model: str, api_key: str | None = None,
+                 dialect_models: dict[str, str] | None = None, timeout: float = 60.0, max_connections: int = 20):
+        super().__init__(name, model, dialect_models, timeout)
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        # One pooled client per provider keeps connections (and TLS sessions) alive between requests.
+        self._client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    def _payload(self, model: str, messages: list[dict], temperature: float, stream: bool) -> dict:
+        return {"model": model, "messages": messages, "temperature": temperature, "stream": stream}
+
+    async def complete(self, model: str, messages: list[dict], temperature: float) -> str:
+        response = await self._client.post("/chat/completions", json=self._payload(model, messages, temperature, False))
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    async def stream(self, model: str, messages: list[dict], temperature: float) -> AsyncIterator[str]:
+        payload = self._payload(model, messages, temperature, True)
+        async with self._client.stream("POST", "/chat/completions", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                token = choices[0].get("delta", {}).get("content") if choices else None
+                if token:
+                    yield token
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+@dataclass
+class ProviderStats:
+    latency: float | None = None
+    failures: int = 0
+    down_until: float = 0.0
+
+
+class LLMRouter:
+    def __init__(self, providers: list[LLMProvider], alpha: float = 0.2, cooldown: float = 30.0):
+        if not providers:
+            raise RuntimeError("No LLM providers configured")
+        self.providers = providers
+        self.alpha = alpha
+        self.cooldown = cooldown
+        self.stats = {provider.name: ProviderStats() for provider in providers}
+
+    def ordered(self) -> list[LLMProvider]:
+        # Healthy providers first, fastest (by EWMA latency) first; unmeasured ones get probed in config order.
+        now = time.monotonic()
+        position = {provider.name: i for i, provider in enumerate(self.providers)}
+        return sorted(
+            self.providers,
+            key=lambda p: (self.stats[p.name].down_until > now, self.stats[p.name].latency or 0.0, position[p.name]),
+        )
+
+    def _record_success(self, provider: LLMProvider, elapsed: float) -> None:
+        stats = self.stats[provider.name]
+        stats.latency = elapsed if stats.latency is None else self.alpha * elapsed + (1 - self.alpha) * stats.latency
+        stats.failures = 0
+        stats.down_until = 0.0
+
+    def _record_failure(self, provider: LLMProvider, error: Exception) -> None:
+        stats = self.stats[provider.name]
+        stats.failures += 1
+        stats.down_until = time.monotonic() + self.cooldown
+        print(f"[LLM] {provider.name} недоступен ({type(error).__name__}: {error}), переключаемся")
+
+    async def complete(self, db_type: str, messages: list[dict], temperature: float) -> str:
+        last_error: Exception | None = None
+        for provider in self.ordered():
+            started = time.monotonic()
+            try:
+                content = await asyncio.wait_for(
+                    provider.complete(provider.model_for(db_type), messages, temperature), provider.timeout
+                )
+                content = html.unescape((content or "").strip())
+                if not content:
+                    raise ValueError(f"{provider.name} returned an empty completion")
+            except Exception as e:
+                self._record_failure(provider, e)
+                last_error = e
+                continue
+            self._record_success(provider, time.monotonic() - started)
+            return content
+        raise last_error
+
+    async def stream(self, db_type: str, messages: list[dict], temperature: float) -> AsyncIterator[str]:
+        last_error: Exception | None = None
+        for provider in self.ordered():
+            started = time.monotonic()
+            streamed = False
+            try:
+                async for token in provider.stream(provider.model_for(db_type), messages, temperature):
+                    streamed = True
+                    yield token
+            except Exception as e:
+                # Tokens already sent cannot be taken back, so only fail over before the first one.
+                if streamed:
+                    raise
+                self._record_failure(provider, e)
+                last_error = e
+                continue
+            self._record_success(provider, time.monotonic() - started)
+            return
+        raise last_error
+
+    async def close(self) -> None:
+        for provider in self.providers:
+            await provider.close()
+
+
+def _dialect_models(prefix: str) -> dict[str, str]:
+    return {
+        key[len(prefix):].lower(): value
+        for key, value in os.environ.items()
+        if key.startswith(prefix) and value
+    }
+
+
+def create_llm_router() -> LLMRouter:
+    providers: list[LLMProvider] = []
+    default_model = os.getenv("LLM_MODEL", "gpt-4o-mini")
+    default_dialect_models = _dialect_models("LLM_MODEL_")
+
+    for name in os.getenv("LLM_PROVIDERS", "g4f").split(","):
+        name = name.strip()
+        if not name:
+            continue
+        env = f"LLM_{name.upper()}_"
+        kind = os.getenv(f"{env}KIND", "g4f" if name == "g4f" else "openai").lower()
+        model = os.getenv(f"{env}MODEL", default_model)
+        dialect_models = {**default_dialect_models, **_dialect_models(f"{env}MODEL_")}
+        timeout = float(os.getenv(f"{env}TIMEOUT", "60"))
+
+        if kind == "g4f":
+            providers.append(G4FProvider(name, model, dialect_models, timeout))
+        elif kind == "openai":
+            base_url = os.getenv(f"{env}BASE_URL")
+            if not base_url:
+                raise RuntimeError(f"{env}BASE_URL is required for provider {name}")
+            providers.append(OpenAICompatibleProvider(
+                name=name,
+                base_url=base_url,
+                model=model,
+                api_key=os.getenv(f"{env}API_KEY"),
+                dialect_models=dialect_models,
+                timeout=timeout,
+                max_connections=int(os.getenv(f"{env}MAX_CONNECTIONS", "20")),
+            ))
+        else:
+            raise RuntimeError(f"Unknown LLM provider kind: {kind}")
+
+    return LLMRouter(
+        providers,
+        alpha=float(os.getenv("LLM_LATENCY_ALPHA", "0.2")),
+        cooldown=float(os.getenv("LLM_FAILOVER_COOLDOWN", "30")),
+    )
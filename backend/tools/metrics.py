@@ -0,0 +1,191 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from prometheus_client import Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from tools.profiler import start_profile, finish_profile
+from dotenv import load_dotenv
+import os
+import re
+import time
+
+load_dotenv()
+
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "1"))
+SLOW_REQUEST_QUERIES = int(os.getenv("SLOW_REQUEST_QUERIES", "30"))
+SLOW_REQUEST_TOP_STATEMENTS = int(os.getenv("SLOW_REQUEST_TOP_STATEMENTS", "10"))
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_SECONDS = Histogram(
+    "texttosql_http_request_seconds", "HTTP request latency", ["method", "route", "status"], buckets=STAGE_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "texttosql_stage_seconds", "Time spent in a pipeline or service stage", ["stage"], buckets=STAGE_BUCKETS
+)
+DB_QUERIES = Histogram(
+    "texttosql_db_queries_per_request", "SQL statements executed per HTTP request", ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+)
+DB_SECONDS = Histogram(
+    "texttosql_db_seconds_per_request", "Cumulative SQL execution time per HTTP request", ["route"],
+    buckets=STAGE_BUCKETS,
+)
+PASSWORD_QUEUE_SECONDS = Histogram(
+    "texttosql_password_queue_seconds", "Wait for a password hashing slot", ["operation"], buckets=STAGE_BUCKETS
+)
+PASSWORD_WORK_SECONDS = Histogram(
+    "texttosql_password_work_seconds", "bcrypt time once a slot is free", ["operation"], buckets=STAGE_BUCKETS
+)
+PASSWORD_REHASHES = Counter("texttosql_password_rehashes_total", "Stored hashes upgraded to the configured cost")
+SLOW_REQUESTS = Counter("texttosql_slow_requests_total", "Requests over the latency or query-count threshold", ["route"])
+SQL_CACHE_LOOKUPS = Counter(
+    "texttosql_sql_cache_lookups_total", "Generated SQL lookups by where they were answered", ["source"]
+)
+LLM_ATTEMPTS = Counter("texttosql_llm_attempts_total", "LLM completions requested", ["mode"])
+LLM_CALLS_SAVED = Counter("texttosql_llm_calls_saved_total", "LLM completions avoided by joining an identical generation")
+SINGLEFLIGHT_SHARED = Counter("texttosql_singleflight_shared_total", "Requests answered by an identical in-flight generation")
+VALIDATION_FAILURES = Counter("texttosql_sql_validation_failures_total", "Rejected generated SQL", ["reason"])
+
+
+@dataclass
+class RequestMetrics:
+    started: float = field(default_factory=time.perf_counter)
+    stages: dict[str, float] = field(default_factory=dict)
+    queries: int = 0
+    db_time: float = 0.0
+    # fingerprint -> [executions, seconds]
+    statements: dict[str, list] = field(default_factory=dict)
+
+
+_current: ContextVar[RequestMetrics | None] = ContextVar("request_metrics", default=None)
+
+
+def current_request() -> RequestMetrics | None:
+    return _current.get()
+
+
+def observe_stage(name: str, elapsed: float) -> None:
+    STAGE_SECONDS.labels(name).observe(elapsed)
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.stages[name] = metrics.stages.get(name, 0.0) + elapsed
+
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - started)
+
+
+def timed(name: str):
+    def decorator(fn):
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with stage(name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|(?<![\w$])\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST_RE = re.compile(r"\(\s*(?:\?|%s|\$\d+|:\w+|%\(\w+\)s)(?:\s*,\s*(?:\?|%s|\$\d+|:\w+|%\(\w+\)s))*\s*\)")
+
+
+def fingerprint(statement: str) -> str:
+    # Expanded IN lists and inlined literals would otherwise make every call of the same query look unique.
+    statement = _LITERAL_RE.sub("?", _WHITESPACE_RE.sub(" ", statement).strip())
+    return _PLACEHOLDER_LIST_RE.sub("(?)", statement)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    # Kept on the execution context, which dies with the statement even when it raises.
+    if context is not None and _current.get() is not None:
+        context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    metrics = _current.get()
+    started = getattr(context, "_query_started", None)
+    if metrics is None or started is None:
+        return
+    elapsed = time.perf_counter() - started
+    metrics.queries += 1
+    metrics.db_time += elapsed
+    entry = metrics.statements.setdefault(fingerprint(statement), [0, 0.0])
+    entry[0] += 1
+    entry[1] += elapsed
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    for name, hook in (("before_cursor_execute", _before_cursor_execute), ("after_cursor_execute", _after_cursor_execute)):
+        if not event.contains(engine.sync_engine, name, hook):
+            event.listen(engine.sync_engine, name, hook)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def server_timing(metrics: RequestMetrics) -> str:
+    entries = [f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in metrics.stages.items()]
+    entries.append(f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"')
+    entries.append(f"total;dur={(time.perf_counter() - metrics.started) * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def log_slow_request(method: str, route: str, elapsed: float, metrics: RequestMetrics) -> None:
+    print(f"[SLOW] {method} {route}: {elapsed * 1000:.0f} мс, {metrics.queries} SQL-запросов "
+          f"({metrics.db_time * 1000:.0f} мс в БД)")
+    top = sorted(metrics.statements.items(), key=lambda item: (item[1][0], item[1][1]), reverse=True)
+    for statement, (count, seconds) in top[:SLOW_REQUEST_TOP_STATEMENTS]:
+        print(f"[SLOW]   {count:>4}x {seconds * 1000:>8.1f} мс  {statement[:300]}")
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        status_code = 500
+        profiler = start_profile()
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(metrics).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - metrics.started
+            route = scope.get("route")
+            # Route templates, not raw paths, keep the label set bounded.
+            route_path = getattr(route, "path", "unmatched")
+            REQUEST_SECONDS.labels(scope["method"], route_path, str(status_code)).observe(elapsed)
+            DB_QUERIES.labels(route_path).observe(metrics.queries)
+            DB_SECONDS.labels(route_path).observe(metrics.db_time)
+
+            slow = elapsed > SLOW_REQUEST_SECONDS or metrics.queries > SLOW_REQUEST_QUERIES
+            if slow:
+                SLOW_REQUESTS.labels(route_path).inc()
+                log_slow_request(scope["method"], route_path, elapsed, metrics)
+            if profiler is not None:
+                await finish_profile(profiler, scope["method"], route_path, slow)
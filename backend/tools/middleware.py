@@ -1,39 +1,89 @@
-from fastapi import Request, HTTPException, status
+from fastapi import Request, HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import JSONResponse
 from service import user as user_service
+from data.config import UserOrm
+from dotenv import load_dotenv
 import jwt
+import os
+import secrets
+
+load_dotenv()
+
+# Prometheus scrapes with its own static token; without one the endpoint is not served at all.
+METRICS_PATH = "/metrics"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="user/login")
 
 
-class AuthMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        public_paths = ["/user/login", "/user/register", "/docs", "/openapi.json", "/user/verify-email", "/user/resend-verification", "/user/oauth/google", "/user/oauth/microsoft"]
-
-        if request.method == "OPTIONS" or request.url.path in public_paths:
-            return await call_next(request)
-
-        try:
-            token = await oauth2_scheme(request)
-            user = await user_service.verify_token(token)
-
-            if user is None:
-                return JSONResponse(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    content={"detail": "Invalid Token..."}
-                )
-        except jwt.ExpiredSignatureError:
-            return JSONResponse(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                content={"detail": "Token has expired"},
-            )
-        except HTTPException:
-            return JSONResponse(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                content={"detail": "Invalid Token..."}
-            )
-
-        response = await call_next(request)
-        return response
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)) -> UserOrm:
+    user_model = getattr(request.state, "user", None)
+    if user_model is None:
+        user_model = await user_service.verify_token(token)
+    return user_model
+
+
+PUBLIC_PATHS = frozenset({
+    "/user/login", "/user/register", "/docs", "/openapi.json", "/user/verify-email", "/user/resend-verification",
+    "/user/oauth/google", "/user/oauth/microsoft",
+})
+
+
+def is_public(method: str, path: str) -> bool:
+    return method == "OPTIONS" or path in PUBLIC_PATHS
+
+
+def bearer_token(scope) -> str | None:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token.strip():
+                return token.strip()
+            return None
+    return None
+
+
+async def metrics_guard(scope, receive, send) -> bool:
+    if not METRICS_TOKEN:
+        response = JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"detail": "Not Found"})
+    elif secrets.compare_digest(bearer_token(scope) or "", METRICS_TOKEN):
+        return True
+    else:
+        response = JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"detail": "Invalid Token..."})
+    await response(scope, receive, send)
+    return False
+
+
+class AuthMiddleware:
+    # Plain ASGI: responses, including streams, go to the client untouched, and no extra task is spawned per request.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or is_public(scope["method"], scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        if scope["path"] == METRICS_PATH:
+            if await metrics_guard(scope, receive, send):
+                await self.app(scope, receive, send)
+            return
+
+        user, detail = None, "Invalid Token..."
+        token = bearer_token(scope)
+        if token is not None:
+            try:
+                user = await user_service.verify_token(token)
+            except jwt.ExpiredSignatureError:
+                detail = "Token has expired"
+            except HTTPException:
+                pass
+
+        if user is None:
+            response = JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"detail": detail})
+            await response(scope, receive, send)
+            return
+
+        # request.state is backed by scope["state"], so get_current_user reads the principal without a second lookup.
+        scope.setdefault("state", {})["user"] = user
+        await self.app(scope, receive, send)
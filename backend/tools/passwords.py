@@ -0,0 +1,91 @@
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException, status
+from tools.metrics import PASSWORD_QUEUE_SECONDS, PASSWORD_WORK_SECONDS, observe_stage
+from dotenv import load_dotenv
+import asyncio
+import bcrypt
+import os
+import time
+
+load_dotenv()
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "5"))
+
+# bcrypt releases the GIL while hashing, so threads are enough to keep it off the event loop.
+_password_pool: ThreadPoolExecutor | None = None
+_slots: asyncio.Semaphore | None = None
+
+
+def get_password_pool() -> ThreadPoolExecutor:
+    global _password_pool
+    if _password_pool is None:
+        _password_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+    return _password_pool
+
+
+def shutdown_password_pool() -> None:
+    global _password_pool, _slots
+    if _password_pool is not None:
+        _password_pool.shutdown(wait=True, cancel_futures=True)
+        _password_pool = None
+    _slots = None
+
+
+async def _run(operation: str, fn, *args):
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS)
+    # Bound locally: shutdown_password_pool may drop the module-level semaphore while this call is in flight.
+    slots = _slots
+
+    queued = time.perf_counter()
+    try:
+        # A login burst waits here, off the loop, instead of piling up unbounded work in the pool.
+        await asyncio.wait_for(slots.acquire(), PASSWORD_HASH_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"[AUTH] Очередь хеширования паролей переполнена ({operation})")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Too many login attempts, try again later", headers={"Retry-After": "1"})
+    started = time.perf_counter()
+    PASSWORD_QUEUE_SECONDS.labels(operation).observe(started - queued)
+    observe_stage("password_queue", started - queued)
+
+    def finished(future: asyncio.Future) -> None:
+        # Runs when the bcrypt thread is done, even if the caller disconnected and stopped waiting long before.
+        slots.release()
+        PASSWORD_WORK_SECONDS.labels(operation).observe(time.perf_counter() - started)
+        if not future.cancelled():
+            future.exception()
+
+    future = asyncio.get_running_loop().run_in_executor(get_password_pool(), fn, *args)
+    future.add_done_callback(finished)
+    try:
+        return await asyncio.shield(future)
+    finally:
+        observe_stage("password_" + operation, time.perf_counter() - started)
+
+
+def _hash(password: str) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(BCRYPT_ROUNDS)).decode("utf-8")
+
+
+def _verify(password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(password.encode("utf-8"), hashed_password.encode("utf-8"))
+
+
+async def hash_password(password: str) -> str:
+    return await _run("hash", _hash, password)
+
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    return await _run("verify", _verify, password, hashed_password)
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    # "$2b$12$<salt+hash>": the cost factor is the second field.
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
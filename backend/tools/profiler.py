@@ -0,0 +1,80 @@
+from dotenv import load_dotenv
+import asyncio
+import cProfile
+import os
+import random
+import re
+import time
+
+load_dotenv()
+
+PROFILER = os.getenv("PROFILER", "cprofile").lower()
+if PROFILER not in ("cprofile", "pyinstrument"):
+    raise RuntimeError(f"Unknown PROFILER: {PROFILER}")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_ONLY = os.getenv("PROFILE_SLOW_ONLY", "true").lower() in ("1", "true", "yes")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+_FILENAME_RE = re.compile(r"[^\w]+")
+
+
+class _CProfile:
+    suffix = ".prof"
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self) -> None:
+        self.profile.enable()
+
+    def stop(self) -> None:
+        self.profile.disable()
+
+    def save(self, path: str) -> None:
+        self.profile.dump_stats(path)
+
+
+class _Pyinstrument:
+    suffix = ".html"
+
+    def __init__(self):
+        from pyinstrument import Profiler
+        self.profile = Profiler(async_mode="enabled")
+
+    def start(self) -> None:
+        self.profile.start()
+
+    def stop(self) -> None:
+        self.profile.stop()
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.profile.output_html())
+
+
+_active = False
+
+
+def start_profile():
+    global _active
+    # Python allows one profiler per thread; cProfile also sees every task that runs on the loop meanwhile.
+    if _active or PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    profiler = _Pyinstrument() if PROFILER == "pyinstrument" else _CProfile()
+    profiler.start()
+    _active = True
+    return profiler
+
+
+async def finish_profile(profiler, method: str, route: str, slow: bool) -> None:
+    global _active
+    profiler.stop()
+    _active = False
+    if PROFILE_SLOW_ONLY and not slow:
+        return
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{method}-{_FILENAME_RE.sub('_', route).strip('_')}-{time.time_ns() % 10**6}"
+    path = os.path.join(PROFILE_DIR, name + profiler.suffix)
+    await asyncio.to_thread(profiler.save, path)
+    print(f"[PROFILE] Профиль запроса сохранён: {path}")
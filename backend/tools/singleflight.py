@@ -0,0 +1,27 @@
+from functools import partial
+from typing import Any, Awaitable, Callable, Hashable
+import asyncio
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        task = self._calls.get(key)
+        shared = task is not None
+        if not shared:
+            # The work runs in its own task so a cancelled caller does not cancel it for everyone else.
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(partial(self._done, key))
+        return await asyncio.shield(task), shared
+
+    def _done(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()
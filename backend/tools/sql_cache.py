@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+from tools.cache import TTLCache
+from tools.metrics import SQL_CACHE_LOOKUPS
+import asyncio
+import sqlite3
+import time
+
+
+class SqlCache:
+    def __init__(self, path: str, maxsize: int, ttl: float, max_rows: int):
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._writes = 0
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sql_cache (id TEXT PRIMARY KEY, sql TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_sql_cache_created_at ON sql_cache (created_at)")
+        # One thread owns the connection: sqlite calls, lock waits included, never run on the event loop.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sql-cache")
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def get(self, key: str) -> str | None:
+        sql = self.memory.get(key)
+        if sql is not None:
+            SQL_CACHE_LOOKUPS.labels("memory").inc()
+            return sql
+
+        row = await self._run(self._fetch, key)
+        if row is None or row[1] + self.ttl <= time.time():
+            # Misses are counted by the caller, once the vector store has been asked as well.
+            return None
+
+        SQL_CACHE_LOOKUPS.labels("disk").inc()
+        self.memory.set(key, row[0])
+        return row[0]
+
+    async def set(self, key: str, sql: str) -> None:
+        self.memory.set(key, sql)
+        await self._run(self._store, key, sql)
+
+    def _fetch(self, key: str):
+        return self._conn.execute("SELECT sql, created_at FROM sql_cache WHERE id = ?", (key,)).fetchone()
+
+    def _store(self, key: str, sql: str) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sql_cache (id, sql, created_at) VALUES (?, ?, ?)", (key, sql, time.time())
+        )
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            self._trim()
+
+    def _trim(self) -> None:
+        self._conn.execute("DELETE FROM sql_cache WHERE created_at <= ?", (time.time() - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM sql_cache WHERE id IN "
+            "(SELECT id FROM sql_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)", (self.max_rows,)
+        )
+
+    def close(self) -> None:
+        self._executor.submit(self._conn.close)
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+from sqlglot import exp
+from sqlglot.errors import OptimizeError, ParseError, SqlglotError
+from sqlglot.optimizer.normalize_identifiers import normalize_identifiers
+from sqlglot.optimizer.qualify import qualify
+from sqlglot.schema import MappingSchema
+import sqlglot
+
+SchemaColumns = dict[str, tuple[str, ...]]
+
+# Returned instead of a verdict when this worker process has not seen the schema yet; resend with the columns.
+SCHEMA_MISSING = "\0schema-missing"
+
+SCHEMA_CACHE_SIZE = 64
+
+_schemas: "OrderedDict[object, tuple[frozenset[str], MappingSchema]]" = OrderedDict()
+
+
+def _normalized(name: str, dialect: str) -> str:
+    # Stored names are exact identifiers, so they resolve the way a quoted identifier does in the dialect.
+    return normalize_identifiers(exp.to_identifier(name, quoted=True), dialect=dialect).name
+
+
+def _build_schema(columns: SchemaColumns, dialect: str) -> tuple[frozenset[str], MappingSchema]:
+    # Types do not matter for name resolution, and stored types are not always parseable by sqlglot.
+    mapping: dict[str, dict[str, str]] = {}
+    for table_name, column_names in columns.items():
+        table = exp.to_identifier(table_name.split(".")[-1], quoted=True).sql(dialect)
+        mapping.setdefault(table, {}).update(
+            {exp.to_identifier(name, quoted=True).sql(dialect): "UNKNOWN" for name in column_names}
+        )
+    known = frozenset(_normalized(table_name.split(".")[-1], dialect) for table_name in columns)
+    return known, MappingSchema(mapping, dialect=dialect)
+
+
+def _schema(schema_key, columns: SchemaColumns | None, dialect: str):
+    if schema_key is None:
+        return _build_schema(columns, dialect) if columns is not None else None
+
+    cached = _schemas.get(schema_key)
+    if cached is not None:
+        _schemas.move_to_end(schema_key)
+        return cached
+    if columns is None:
+        return None
+    cached = _schemas[schema_key] = _build_schema(columns, dialect)
+    if len(_schemas) > SCHEMA_CACHE_SIZE:
+        _schemas.popitem(last=False)
+    return cached
+
+
+def check_sql(sql_query: str, dialect: str, schema_key=None, columns: SchemaColumns | None = None) -> str | None:
+    try:
+        expression = sqlglot.parse_one(sql_query, dialect=dialect)
+    except ParseError as e:
+        first = e.errors[0] if e.errors else {}
+        return f"Syntax error: {first.get('description', e)} (line {first.get('line')}, col {first.get('col')})"
+    except SqlglotError as e:
+        return f"Syntax error: {e}"
+    if expression is None:
+        return "Empty query"
+    if schema_key is None and columns is None:
+        return None
+
+    schema = _schema(schema_key, columns, dialect)
+    if schema is None:
+        return SCHEMA_MISSING
+    known, mapping = schema
+
+    expression = normalize_identifiers(expression, dialect=dialect)
+    ctes = {cte.alias_or_name for cte in expression.find_all(exp.CTE)}
+    unknown = sorted({
+        table.name for table in expression.find_all(exp.Table)
+        if table.name and table.name not in ctes and table.name not in known
+    })
+    if unknown:
+        return f"Unknown table(s): {', '.join(unknown)}"
+
+    for table in expression.find_all(exp.Table):
+        table.set("db", None)
+        table.set("catalog", None)
+    try:
+        qualify(expression, schema=mapping, dialect=dialect, validate_qualify_columns=True)
+    except OptimizeError as e:
+        return str(e)
+    except Exception as e:
+        # The optimizer does not cover every construct of every dialect; do not reject SQL it cannot follow.
+        print(f"[SQL] Не удалось проверить запрос по схеме: {type(e).__name__}: {e}")
+    return None
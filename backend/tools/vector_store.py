@@ -0,0 +1,275 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+import asyncio
+import hashlib
+import importlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import numpy as np
+
+FILTER_FIELDS = ("db_type", "schema_id")
+
+
+@dataclass(frozen=True)
+class VectorHit:
+    id: str
+    score: float
+    fields: dict
+
+
+class VectorStore(ABC):
+    score_threshold: float = 0.90
+
+    @abstractmethod
+    async def fetch(self, ids: list[str]) -> dict[str, dict]:
+        ...
+
+    @abstractmethod
+    async def search(self, text: str, top_k: int, metadata_filter: dict[str, str]) -> list[VectorHit]:
+        ...
+
+    @abstractmethod
+    async def upsert(self, records: list[dict]) -> None:
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+class PineconeStore(VectorStore):
+    def __init__(self, api_key: str | None, index_name: str, namespace: str,
+                 max_concurrency: int = 8, timeout: float = 5.0, score_threshold: float = 0.90,
+                 rerank_model: str | None = "bge-reranker-v2-m3"):
+        self.index_name = index_name
+        self.namespace = namespace
+        self.timeout = timeout
+        self.score_threshold = score_threshold
+        self.rerank_model = rerank_model
+        self._api_key = api_key
+        self._index = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="pinecone")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def _get_index(self):
+        with self._lock:
+            if self._index is None:
+                import pinecone
+
+                pc = pinecone.Pinecone(api_key=self._api_key)
+                if not pc.has_index(self.index_name):
+                    pc.create_index_for_model(
+                        name=self.index_name,
+                        cloud="aws",
+                        region="us-east-1",
+                        embed={"model": "llama-text-embed-v2", "field_map": {"text": "chunk_text"}}
+                    )
+                self._index = pc.Index(self.index_name)
+            return self._index
+
+    def _run(self, method: str, **kwargs):
+        return getattr(self._get_index(), method)(namespace=self.namespace, **kwargs)
+
+    def _release(self, future: asyncio.Future) -> None:
+        self._semaphore.release()
+        if not future.cancelled():
+            future.exception()
+
+    async def _call(self, method: str, **kwargs):
+        async with asyncio.timeout(self.timeout):
+            await self._semaphore.acquire()
+            future = asyncio.get_running_loop().run_in_executor(self._executor, partial(self._run, method, **kwargs))
+            # A timed-out caller stops waiting, but the thread keeps running; the slot stays taken until it ends.
+            future.add_done_callback(self._release)
+            return await asyncio.shield(future)
+
+    async def fetch(self, ids: list[str]) -> dict[str, dict]:
+        response = await self._call("fetch", ids=ids)
+        if not response or not response.vectors:
+            return {}
+        return {vector_id: vector.metadata or {} for vector_id, vector in response.vectors.items()}
+
+    async def search(self, text: str, top_k: int, metadata_filter: dict[str, str]) -> list[VectorHit]:
+        rerank = None
+        if self.rerank_model:
+            rerank = {"model": self.rerank_model, "top_n": top_k, "rank_fields": ["chunk_text"]}
+        response = await self._call(
+            "search",
+            query={
+                "top_k": top_k,
+                "inputs": {"text": text},
+                "filter": {key: {"$eq": value} for key, value in metadata_filter.items()},
+            },
+            rerank=rerank,
+        )
+        if not response or "result" not in response:
+            return []
+        return [VectorHit(id=hit["_id"], score=hit["_score"], fields=hit["fields"]) for hit in response["result"]["hits"]]
+
+    async def upsert(self, records: list[dict]) -> None:
+        await self._call("upsert_records", records=records)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class HashingEmbedder:
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _features(self, text: str) -> list[str]:
+        words = re.findall(r"\w+", text.lower())
+        grams = [word[i:i + 3] for word in words for i in range(max(1, len(word) - 2))]
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])] + grams
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+                vectors[row, digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+def load_embedder(spec: str | None):
+    if not spec:
+        return HashingEmbedder()
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr)()
+
+
+class LocalVectorStore(VectorStore):
+    def __init__(self, path: str, embedder=None, score_threshold: float = 0.90, initial_capacity: int = 1024):
+        os.makedirs(path, exist_ok=True)
+        self.score_threshold = score_threshold
+        self.embedder = embedder or HashingEmbedder()
+        self.dim = self.embedder.dim
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(path, "records.sqlite3"), timeout=5,
+                                     isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records (row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, "
+            "db_type TEXT, schema_id TEXT, fields TEXT NOT NULL)"
+        )
+        self._rows: dict[str, int] = {}
+        self._groups: dict[tuple, list[int]] = {}
+        self._loaded_row = -1
+        self._vectors: np.memmap | None = None
+        self._capacity = 0
+        self._ensure_capacity(initial_capacity)
+        self._refresh()
+
+    def _ensure_capacity(self, rows: int) -> None:
+        if not os.path.exists(self._vectors_path):
+            open(self._vectors_path, "wb").close()
+        file_rows = os.path.getsize(self._vectors_path) // (self.dim * 4)
+        if file_rows < rows:
+            file_rows = max(rows, file_rows * 2)
+            with open(self._vectors_path, "r+b") as f:
+                f.truncate(file_rows * self.dim * 4)
+        if file_rows != self._capacity:
+            if self._vectors is not None:
+                self._vectors.flush()
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(file_rows, self.dim))
+            self._capacity = file_rows
+
+    def _refresh(self) -> None:
+        # Rows appended by other workers sharing the same directory.
+        new_rows = self._conn.execute(
+            "SELECT row, id, db_type, schema_id FROM records WHERE row > ? ORDER BY row", (self._loaded_row,)
+        ).fetchall()
+        if not new_rows:
+            return
+        self._ensure_capacity(new_rows[-1][0] + 1)
+        for row, record_id, db_type, schema_id in new_rows:
+            self._rows[record_id] = row
+            self._groups.setdefault((db_type, schema_id), []).append(row)
+        self._loaded_row = new_rows[-1][0]
+
+    def _fetch(self, ids: list[str]) -> dict[str, dict]:
+        placeholders = ",".join("?" for _ in ids)
+        with self._lock:
+            rows = self._conn.execute(f"SELECT id, fields FROM records WHERE id IN ({placeholders})", ids).fetchall()
+        return {record_id: json.loads(fields) for record_id, fields in rows}
+
+    def _search(self, text: str, top_k: int, metadata_filter: dict[str, str]) -> list[VectorHit]:
+        with self._lock:
+            self._refresh()
+            if set(metadata_filter) == set(FILTER_FIELDS):
+                rows = self._groups.get(tuple(metadata_filter[key] for key in FILTER_FIELDS), [])
+            else:
+                rows = [row for (db_type, schema_id), group in self._groups.items()
+                        if metadata_filter.get("db_type", db_type) == db_type and metadata_filter.get("schema_id", schema_id) == schema_id
+                        for row in group]
+            if not rows:
+                return []
+            candidates = np.asarray(rows)
+            scores = self._vectors[candidates] @ self.embedder.embed([text])[0]
+
+            k = min(top_k, len(candidates))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            found = self._conn.execute(
+                f"SELECT row, id, fields FROM records WHERE row IN ({','.join('?' for _ in best)})",
+                [int(candidates[i]) for i in best],
+            ).fetchall()
+        by_row = {row: (record_id, json.loads(fields)) for row, record_id, fields in found}
+        return [
+            VectorHit(id=by_row[int(candidates[i])][0], score=float(scores[i]), fields=by_row[int(candidates[i])][1])
+            for i in best if int(candidates[i]) in by_row
+        ]
+
+    def _upsert(self, records: list[dict]) -> None:
+        vectors = self.embedder.embed([record.get("chunk_text", "") for record in records])
+        with self._lock:
+            for record, vector in zip(records, vectors):
+                fields = {key: value for key, value in record.items() if key != "_id"}
+                self._conn.execute(
+                    "INSERT INTO records (id, db_type, schema_id, fields) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET fields = excluded.fields",
+                    (record["_id"], record.get("db_type"), record.get("schema_id"), json.dumps(fields)),
+                )
+                self._refresh()
+                self._vectors[self._rows[record["_id"]]] = vector
+            self._vectors.flush()
+
+    async def fetch(self, ids: list[str]) -> dict[str, dict]:
+        return await asyncio.to_thread(self._fetch, ids)
+
+    async def search(self, text: str, top_k: int, metadata_filter: dict[str, str]) -> list[VectorHit]:
+        return await asyncio.to_thread(self._search, text, top_k, metadata_filter)
+
+    async def upsert(self, records: list[dict]) -> None:
+        await asyncio.to_thread(self._upsert, records)
+
+    def close(self) -> None:
+        if self._vectors is not None:
+            self._vectors.flush()
+        self._conn.close()
+
+
+def create_vector_store() -> VectorStore:
+    backend = os.getenv("VECTOR_STORE", "pinecone").lower()
+    if backend == "local":
+        return LocalVectorStore(
+            path=os.getenv("LOCAL_VECTOR_PATH", "vector_store"),
+            embedder=load_embedder(os.getenv("LOCAL_EMBEDDER")),
+            score_threshold=float(os.getenv("LOCAL_VECTOR_THRESHOLD", "0.90")),
+        )
+    if backend != "pinecone":
+        raise RuntimeError(f"Unknown VECTOR_STORE backend: {backend}")
+    return PineconeStore(
+        api_key=os.getenv("PINECONE_API_KEY"),
+        index_name="text-to-sql",
+        namespace="sql-namespace",
+        max_concurrency=int(os.getenv("PINECONE_MAX_CONCURRENCY", "8")),
+        timeout=float(os.getenv("PINECONE_TIMEOUT", "5")),
+    )
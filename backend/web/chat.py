@@ -1,32 +1,54 @@
 from fastapi import APIRouter, Depends, status, Query
-from fastapi.security import OAuth2PasswordBearer
+from fastapi.responses import StreamingResponse
 from service import chat
 from model.chat import Chat, ChatRequest
+from model.page import Page
 from typing import Optional
+from tools.middleware import get_current_user
+from data.config import UserOrm
+from typing import AsyncIterator
+import json
 
 router = APIRouter(prefix="/database", tags=["chat"])
 
-oauth2schema = OAuth2PasswordBearer(tokenUrl="user/login")
-
 
 @router.post("/{db_name}/chat")
-async def convert_request(chat_request: ChatRequest, db_name: str, token: str = Depends(oauth2schema)) -> dict:
-    result = await chat.sql_generation(chat_request, db_name, token)
+async def convert_request(chat_request: ChatRequest, db_name: str, user_model: UserOrm = Depends(get_current_user)) -> dict:
+    result = await chat.sql_generation(chat_request, db_name, user_model)
     return result
 
 
+async def sse_stream(events: AsyncIterator[dict]) -> AsyncIterator[str]:
+    async for event in events:
+        yield f"event: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+
+
+@router.post("/{db_name}/chat/stream")
+async def convert_request_stream(chat_request: ChatRequest, db_name: str, user_model: UserOrm = Depends(get_current_user)):
+    events = await chat.stream_sql_generation(chat_request, db_name, user_model)
+    return StreamingResponse(
+        sse_stream(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/{db_name}/chat")
 async def chat_history(
     db_name: str,
     page: Optional[int] = Query(None, ge=1),
     page_size: Optional[int] = Query(None, gt=0, le=100),
     skip: Optional[int] = Query(None, ge=0),
-    token: str = Depends(oauth2schema),
-) -> list[Chat] | None:
-    return await chat.get_chat_history(db_name, page, page_size, skip, token)
+    cursor: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, gt=0, le=100),
+    user_model: UserOrm = Depends(get_current_user),
+) -> list[Chat] | Page[Chat] | None:
+    if cursor is not None or limit is not None:
+        return await chat.get_chat_history_page(db_name, cursor, limit or 50, user_model)
+    return await chat.get_chat_history(db_name, page, page_size, skip, user_model)
 
 
 @router.delete("/{db_name}/chat")
-async def clear_chat_history(db_name: str, token: str = Depends(oauth2schema)) -> dict:
-    result = await chat.clear_chat_history(token, db_name)
+async def clear_chat_history(db_name: str, user_model: UserOrm = Depends(get_current_user)) -> dict:
+    result = await chat.clear_chat_history(user_model, db_name)
     return result
@@ -1,21 +1,25 @@
 from fastapi import APIRouter, Depends, status, Query, Form, File, UploadFile
-from fastapi.security import OAuth2PasswordBearer
 from service import database
-from model.database import Database
+from model.database import Database, DatabaseImport
+from model.page import Page
 from typing import Optional
 from pydantic import constr
+from tools.middleware import get_current_user
+from data.config import UserOrm
 
 router = APIRouter(prefix="/database", tags=["database"])
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="user/login")
-
 
 @router.get("s")
 async def get_all_databases(page: Optional[int] = Query(None, ge=1), page_size: int = Query(10, gt=0, le=100),
-                            skip: Optional[int] = Query(None, ge=0), token: str = Depends(oauth2_scheme)
-
-                            ) -> list[Database] | None:
-    databases = await database.get_databases(token, page, page_size, skip)
+                            skip: Optional[int] = Query(None, ge=0), cursor: Optional[str] = Query(None),
+                            limit: Optional[int] = Query(None, gt=0, le=100),
+                            user_model: UserOrm = Depends(get_current_user)
+
+                            ) -> list[Database] | Page[Database] | None:
+    if cursor is not None or limit is not None:
+        return await database.get_databases_page(user_model, cursor, limit or page_size)
+    databases = await database.get_databases(user_model, page, page_size, skip)
     return databases
 
 
@@ -24,13 +28,13 @@ async def create_database(
     db_name: constr(min_length=3) = Form(...),
     db_type: constr(pattern="^(postgresql|mysql|sqlite|mssql|oracle)$") = Form(...),
     file: UploadFile = File(None),
-    token: str = Depends(oauth2_scheme)
-) -> Database | None:
+    user_model: UserOrm = Depends(get_current_user)
+) -> DatabaseImport | None:
     data = Database(db_name=db_name, db_type=db_type)
-    return await database.create_database(token, data, file)
+    return await database.create_database(user_model, data, file)
 
 
 @router.delete("/{db_name}")
-async def delete_db(db_name, token: str = Depends(oauth2_scheme)) -> dict:
-    result = await database.delete(token, db_name)
+async def delete_db(db_name, user_model: UserOrm = Depends(get_current_user)) -> dict:
+    result = await database.delete(user_model, db_name)
     return result
@@ -0,0 +1,11 @@
+from fastapi import APIRouter, Response
+from tools.metrics import render_metrics
+from tools.middleware import METRICS_PATH
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get(METRICS_PATH, include_in_schema=False)
+async def metrics() -> Response:
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
@@ -1,29 +1,32 @@
 from fastapi import APIRouter, Depends, status, Query
 from model.table import Table
-from fastapi.security import OAuth2PasswordBearer
+from model.page import Page
 from service import table as service
 from typing import Optional
+from tools.middleware import get_current_user
+from data.config import UserOrm
 
 router = APIRouter(prefix="/database", tags=["Table"])
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="user/login")
-
 
 @router.get("/{db_name}/tables")
 async def get_tables(db_name: str, page: Optional[int] = Query(None, ge=1), page_size: int = Query(10, gt=0, le=100),
-                     skip: Optional[int] = Query(None, ge=0), token: str = Depends(oauth2_scheme)) -> list[
-                                                                                                          Table] | None:
-    tables = await service.get_all_tables_from_db(db_name, token, page, page_size, skip)
+                     skip: Optional[int] = Query(None, ge=0), cursor: Optional[str] = Query(None),
+                     limit: Optional[int] = Query(None, gt=0, le=100),
+                     user_model: UserOrm = Depends(get_current_user)) -> list[Table] | Page[Table] | None:
+    if cursor is not None or limit is not None:
+        return await service.get_tables_page(db_name, user_model, cursor, limit or page_size)
+    tables = await service.get_all_tables_from_db(db_name, user_model, page, page_size, skip)
     return tables
 
 
 @router.post("/{db_name}/table", status_code=status.HTTP_201_CREATED)
-async def add_table(table: Table, db_name: str, token: str = Depends(oauth2_scheme)) -> Table | None:
-    table = await service.add_table_to_db(db_name, token, table)
+async def add_table(table: Table, db_name: str, user_model: UserOrm = Depends(get_current_user)) -> Table | None:
+    table = await service.add_table_to_db(db_name, user_model, table)
     return table
 
 
 @router.delete("/{db_name}/table/{table_name}")
-async def delete(db_name: str, table_name: str, token: str = Depends(oauth2_scheme)) -> dict:
-    result = await service.delete_table(db_name, table_name, token)
+async def delete(db_name: str, table_name: str, user_model: UserOrm = Depends(get_current_user)) -> dict:
+    result = await service.delete_table(db_name, table_name, user_model)
     return result
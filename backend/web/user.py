@@ -1,15 +1,15 @@
-from fastapi import APIRouter, status, security, Depends
+from fastapi import APIRouter, status, Depends
 
 from model.user import LoginRequest, User, Password, VerifyEmailRequest, ResendVerificationRequest, OAuthRequest
 
 from service import user as user_service
+from tools.middleware import get_current_user
+from data.config import UserOrm
 
 
 
 router = APIRouter(prefix="/user", tags=["User"])
 
-oauth2schema = security.OAuth2PasswordBearer(tokenUrl="user/login")
-
 
 @router.post("/login")
 async def login(user: LoginRequest) -> dict:
@@ -46,18 +46,18 @@ async def microsoft_login(payload: OAuthRequest):
 
 
 @router.delete("/delete", status_code=status.HTTP_200_OK)
-async def delete(password: Password, token: str = Depends(oauth2schema)) -> dict:
-    result = await user_service.delete_account(password, token)
+async def delete(password: Password, user_model: UserOrm = Depends(get_current_user)) -> dict:
+    result = await user_service.delete_account(password, user_model)
     return result
 
 
 @router.get("/me", status_code=status.HTTP_200_OK)
-async def me(token: str = Depends(oauth2schema)) -> dict:
-    result = await user_service.checkme(token)
+async def me(user_model: UserOrm = Depends(get_current_user)) -> dict:
+    result = await user_service.checkme(user_model)
     return result
 
 
 @router.get("/profile", status_code=status.HTTP_200_OK)
-async def get_profile(token: str = Depends(oauth2schema)) -> dict:
-    profile = await user_service.get_profile(token)
+async def get_profile(user_model: UserOrm = Depends(get_current_user)) -> dict:
+    profile = await user_service.get_profile(user_model)
     return profile